@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 from django_jinja import base
 
@@ -9,3 +10,25 @@ class DjangoJinjaAppConfig(AppConfig):
 
     def ready(self):
         base.patch_django_for_autoescape()
+
+        # Connect the receivers refreshing the template loaders
+        # when the development server detects template changes.
+        from . import autoreload  # noqa: F401
+
+        self.warmup_templates()
+
+    def warmup_templates(self):
+        """
+        Load the templates of the Jinja2 backends configured with
+        the warmup option. Engines are only instantiated when at least
+        one backend enables it.
+        """
+        if not any(t.get("OPTIONS", {}).get("warmup", {}).get("enabled") for t in settings.TEMPLATES):
+            return
+
+        from django.template import engines
+        from .backend import Jinja2
+
+        for engine in engines.all():
+            if isinstance(engine, Jinja2) and engine.warmup_enabled:
+                engine.warmup()
@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from django.dispatch import receiver
+from django.template import engines
+from django.utils._os import to_path
+from django.utils.autoreload import autoreload_started
+from django.utils.autoreload import file_changed
+
+from .backend import Jinja2
+
+
+def get_template_directories():
+    """
+    Template directories of the Jinja2 backends with auto_reload enabled.
+    """
+    cwd = Path.cwd()
+    items = set()
+    for backend in engines.all():
+        if not isinstance(backend, Jinja2) or not backend.env.auto_reload:
+            continue
+
+        items.update(cwd / to_path(directory) for directory in backend.template_dirs if directory)
+    return items
+
+
+def reset_loaders():
+    for backend in engines.all():
+        if isinstance(backend, Jinja2) and backend.env.auto_reload:
+            backend.reset()
+
+
+@receiver(autoreload_started, dispatch_uid="django_jinja_template_watch_changes")
+def watch_for_template_changes(sender, **kwargs):
+    for directory in get_template_directories():
+        sender.watch_dir(directory, "**/*")
+
+
+@receiver(file_changed, dispatch_uid="django_jinja_template_file_changed")
+def template_changed(sender, file_path, **kwargs):
+    if file_path.suffix == ".py":
+        return
+    for template_dir in get_template_directories():
+        if template_dir in file_path.parents:
+            reset_loaders()
+            return True
@@ -9,11 +9,20 @@ django_jinja easy with django 1.8.
 
 import sys
 import os
+import logging
+import time
 import os.path as path
+import re
 import functools
+import inspect
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
 
 import jinja2
+from asgiref.sync import sync_to_async
+from jinja2.environment import copy_cache
+from jinja2.runtime import missing
 from django.conf import settings
 from django.core import signals
 from django.core.exceptions import ImproperlyConfigured
@@ -31,10 +40,16 @@ from django.utils.safestring import mark_safe
 
 from . import base
 from . import builtins
+from . import cache
 from . import library
+from . import staticfiles
+from . import stats
 from . import utils
 
 
+logger = logging.getLogger(__name__)
+
+
 class Origin:
     """
     A container to hold debug information as described in the template API
@@ -45,6 +60,57 @@ class Origin:
         self.template_name = template_name
 
 
+# Name of the context entry that holds the lazily evaluated
+# context processors of the current render.
+LAZY_CONTEXT_KEY = "__django_jinja_lazy_context__"
+
+
+class LazyContextProcessors:
+    """
+    Runs the lazy context processors of a render on demand, the first
+    time the template resolves one of the keys they provide.
+    """
+    def __init__(self, backend, request):
+        self.backend = backend
+        self.request = request
+        self.results = backend._get_context_processors_results(request)
+        self.output = {}
+
+    def resolve_or_missing(self, key):
+        processor = self.backend.lazy_context_processors.get(key)
+        if processor is None:
+            return missing
+
+        data = self.output.get(processor)
+        if data is None:
+            data = self.backend._call_context_processor(processor, self.request, self.results)
+            self.output[processor] = data
+
+        return data.get(key, missing)
+
+
+class LazyContextMixin:
+    """
+    Jinja context mixin that resolves names provided by lazy context
+    processors. As with eager context processors, their values take
+    precedence over the values passed by the view.
+    """
+    def resolve_or_missing(self, key):
+        if key in self.vars:
+            return self.vars[key]
+
+        lazy = self.parent.get(LAZY_CONTEXT_KEY)
+        if lazy is not None:
+            rv = lazy.resolve_or_missing(key)
+            if rv is not missing:
+                return rv
+
+        return super().resolve_or_missing(key)
+
+    def __contains__(self, name):
+        return self.resolve_or_missing(name) is not missing
+
+
 class Template:
     def __init__(self, template, backend):
         self.template = template
@@ -58,10 +124,68 @@ class Template:
     def render(self, context=None, request=None):
         return mark_safe(self._process_template(self.template.render, context, request))
 
-    def stream(self, context=None, request=None):
-        return self._process_template(self.template.stream, context, request)
+    def stream(self, context=None, request=None, buffer_size=None):
+        """
+        Render the template as an iterator of strings. When a buffer size is
+        given (or configured with the ``stream_buffer_size`` option), the
+        generated chunks are grouped in chunks of at least that many
+        characters, flushed early by the ``{% flush %}`` tag.
+        """
+        if buffer_size is None:
+            buffer_size = self.backend.stream_buffer_size
+
+        if not buffer_size:
+            return self._process_template(self.template.stream, context, request)
+
+        handler = functools.partial(self._buffered_stream, buffer_size)
+        return self._process_template(handler, context, request)
+
+    def _buffered_stream(self, buffer_size, context):
+        buffer = base.StreamBuffer(buffer_size)
+        context[base.STREAM_BUFFER_KEY] = buffer
+        return buffer.iter_chunks(self.template.generate(context))
+
+    async def render_async(self, context=None, request=None):
+        """
+        Render the template without blocking the event loop. Requires
+        the backend to be configured with ``enable_async``.
+        """
+        context = await self._process_context_async(context, request)
+        return mark_safe(await self.template.render_async(context))
+
+    async def stream_async(self, context=None, request=None):
+        """
+        Async generator version of ``stream``. Requires the backend to
+        be configured with ``enable_async``.
+        """
+        context = await self._process_context_async(context, request)
+        async for chunk in self.template.generate_async(context):
+            yield chunk
 
     def _process_template(self, handler, context=None, request=None):
+        context = self._prepare_context(context, request)
+
+        if request is not None:
+            # Support for django context processors
+            for data in self.backend._context_processors_output(request):
+                context.update(data)
+
+        return handler(self._finalize_context(context, request))
+
+    async def _process_context_async(self, context=None, request=None):
+        context = self._prepare_context(context, request)
+
+        if request is not None:
+            # Support for django context processors, awaiting the
+            # output of the async ones.
+            async for data in self.backend._context_processors_output_async(request):
+                context.update(data)
+
+        # Template lookups can not be awaited: lazy context processors
+        # were run along with the others.
+        return self._finalize_context(context, request, lazy=False)
+
+    def _prepare_context(self, context, request):
         if context is None:
             context = {}
 
@@ -78,9 +202,11 @@ class Template:
             context["request"] = request
             context["csrf_token"] = SimpleLazyObject(_get_val)
 
-            # Support for django context processors
-            for processor in self.backend.context_processors:
-                context.update(processor(request))
+        return context
+
+    def _finalize_context(self, context, request, lazy=True):
+        if lazy and request is not None and self.backend.lazy_context_processors:
+            context[LAZY_CONTEXT_KEY] = LazyContextProcessors(self.backend, request)
 
         if self.backend._tmpl_debug:
             from django.test import signals
@@ -102,12 +228,16 @@ class Template:
                                            template=self,
                                            context=context)
 
-        return handler(context)
+        return context
 
 
 class Jinja2(BaseEngine):
     app_dirname = "templates"
 
+    # Seconds a missing template is remembered with auto_reload enabled,
+    # so that templates added later are found under any server.
+    missing_templates_ttl = 2
+
     @staticmethod
     @functools.lru_cache()
     def get_default():
@@ -143,6 +273,7 @@ class Jinja2(BaseEngine):
 
         newstyle_gettext = options.pop("newstyle_gettext", True)
         context_processors = options.pop("context_processors", [])
+        lazy_context_processors = options.pop("lazy_context_processors", {})
         match_extension = options.pop("match_extension", ".jinja")
         match_regex = options.pop("match_regex", None)
         environment_clspath = options.pop("environment", "jinja2.Environment")
@@ -151,6 +282,15 @@ class Jinja2(BaseEngine):
         extra_globals = options.pop("globals", {})
         extra_constants = options.pop("constants", {})
         translation_engine = options.pop("translation_engine", "django.utils.translation")
+        stream_buffer_size = options.pop("stream_buffer_size", None)
+        compiled_templates = options.pop("compiled_templates", None)
+
+        collect_stats = options.pop("stats", False)
+        fragment_cache = options.pop("fragment_cache", {})
+
+        warmup = options.pop("warmup", {})
+        warmup.setdefault("enabled", False)
+        warmup.setdefault("threads", 4)
         policies = options.pop("policies", {})
 
         tmpl_debug = options.pop("debug", settings.DEBUG)
@@ -159,6 +299,10 @@ class Jinja2(BaseEngine):
         bytecode_cache.setdefault("enabled", False)
         bytecode_cache.setdefault("backend", "django_jinja.cache.BytecodeCache")
 
+        context_processors_cache = options.pop("context_processors_cache", {})
+        context_processors_cache.setdefault("enabled", False)
+        context_processors_cache.setdefault("exclude", [])
+
         undefined = options.pop("undefined", None)
         if undefined is not None:
             if isinstance(undefined, str):
@@ -181,6 +325,15 @@ class Jinja2(BaseEngine):
             loader_cls = jinja2.FileSystemLoader
 
         options.setdefault("loader", loader_cls(self.template_dirs))
+
+        # Templates precompiled with the compilejinja command are loaded
+        # first, falling back to the regular loader for the missing ones.
+        self._source_loader = options["loader"]
+        if compiled_templates:
+            options["loader"] = jinja2.ChoiceLoader([
+                jinja2.ModuleLoader(compiled_templates),
+                self._source_loader,
+            ])
         options.setdefault("extensions", builtins.DEFAULT_EXTENSIONS)
         options.setdefault("auto_reload", settings.DEBUG)
         options.setdefault("autoescape", True)
@@ -189,6 +342,18 @@ class Jinja2(BaseEngine):
 
         self.env = environment_cls(**options)
 
+        # Storage of the ``{% cache %}`` tag fragments.
+        self.env.fragment_cache = cache.FragmentCache(**fragment_cache)
+
+        if lazy_context_processors:
+            self.env.context_class = type("LazyContext", (LazyContextMixin, self.env.context_class), {})
+
+        # Backend Template wrappers, and the names of the templates
+        # known to be missing, are memoized with the same size limits
+        # as the jinja environment cache.
+        self._template_cache = copy_cache(self.env.cache)
+        self._missing_templates = copy_cache(self.env.cache)
+
         # Initialize i18n support
         if settings.USE_I18N:
             translation = import_module(translation_engine)
@@ -196,10 +361,19 @@ class Jinja2(BaseEngine):
         else:
             self.env.install_null_translations(newstyle=newstyle_gettext)
 
+        if isinstance(match_regex, str):
+            match_regex = re.compile(match_regex)
+
         self._context_processors = context_processors
+        self._lazy_context_processors = lazy_context_processors
+        self._context_processors_cache = context_processors_cache
+        self._context_processors_results = weakref.WeakKeyDictionary()
         self._match_regex = match_regex
         self._match_extension = match_extension
         self._tmpl_debug = tmpl_debug
+        self._stream_buffer_size = stream_buffer_size
+        self._compiled_templates = compiled_templates
+        self._warmup = warmup
         self._bytecode_cache = bytecode_cache
 
         self._initialize_builtins(filters=extra_filters,
@@ -211,10 +385,20 @@ class Jinja2(BaseEngine):
         self._initialize_thirdparty()
         self._initialize_bytecode_cache()
 
+        self._stats = None
+        if collect_stats:
+            self._stats = stats.TemplateStats()
+            stats.instrument(self, self._stats)
+
     def _initialize_bytecode_cache(self):
         if self._bytecode_cache["enabled"]:
+            # Any other entry is passed as keyword argument to the backend.
+            options = self._bytecode_cache.copy()
+            for name in ("name", "enabled", "backend"):
+                options.pop(name)
+
             cls = utils.load_class(self._bytecode_cache["backend"])
-            self.env.bytecode_cache = cls(self._bytecode_cache["name"])
+            self.env.bytecode_cache = cls(self._bytecode_cache["name"], **options)
 
     def _initialize_thirdparty(self):
         """
@@ -270,10 +454,104 @@ class Jinja2(BaseEngine):
     def context_processors(self):
         return tuple(import_string(path) for path in self._context_processors)
 
+    @cached_property
+    def uncached_context_processors(self):
+        return frozenset(import_string(path) for path in self._context_processors_cache["exclude"])
+
+    @cached_property
+    def lazy_context_processors(self):
+        """
+        Mapping of context key to the lazy context processor providing it.
+        """
+        result = {}
+        for path, keys in self._lazy_context_processors.items():
+            if path not in self._context_processors:
+                raise ImproperlyConfigured(
+                    f"Lazy context processor {path} is not listed in context_processors.")
+
+            processor = import_string(path)
+            for key in keys:
+                result[key] = processor
+        return result
+
+    @cached_property
+    def eager_context_processors(self):
+        lazy = set(self.lazy_context_processors.values())
+        return tuple(processor for processor in self.context_processors if processor not in lazy)
+
+    def _get_context_processors_results(self, request):
+        if not self._context_processors_cache["enabled"]:
+            return None
+
+        try:
+            return self._context_processors_results.setdefault(request, {})
+        except TypeError:
+            # The request object does not support weak references.
+            return None
+
+    def _call_context_processor(self, processor, request, results=None):
+        if results is None or processor in self.uncached_context_processors:
+            return processor(request)
+
+        data = results.get(processor)
+        if data is None:
+            data = results[processor] = processor(request)
+        return data
+
+    def _context_processors_output(self, request):
+        """
+        Yield the output of each eager context processor for the given request.
+
+        When the context processors cache is enabled, the output of every
+        processor (except the excluded ones) is computed once per request
+        object and reused for all subsequent renders of that request.
+        """
+        results = self._get_context_processors_results(request)
+        for processor in self.eager_context_processors:
+            yield self._call_context_processor(processor, request, results)
+
+    async def _call_context_processor_async(self, processor, request, results=None):
+        cached = results is not None and processor not in self.uncached_context_processors
+        if cached:
+            data = results.get(processor)
+            if data is not None:
+                return data
+
+        if inspect.iscoroutinefunction(processor):
+            data = await processor(request)
+        else:
+            # Sync processors may use the ORM, which is not allowed
+            # from the event loop.
+            data = await sync_to_async(processor)(request)
+            if inspect.isawaitable(data):
+                data = await data
+
+        if cached:
+            results[processor] = data
+        return data
+
+    async def _context_processors_output_async(self, request):
+        """
+        Same as ``_context_processors_output`` but awaits the output
+        of async context processors, runs the sync ones in a thread and
+        includes the lazy ones.
+        """
+        results = self._get_context_processors_results(request)
+        for processor in self.context_processors:
+            yield await self._call_context_processor_async(processor, request, results)
+
     @property
     def match_extension(self):
         return self._match_extension
 
+    @property
+    def stream_buffer_size(self):
+        return self._stream_buffer_size
+
+    @property
+    def compiled_templates(self):
+        return self._compiled_templates
+
     def from_string(self, template_code):
         return Template(self.env.from_string(template_code), self)
 
@@ -283,12 +561,31 @@ class Jinja2(BaseEngine):
                                    self._match_regex)
 
     def get_template(self, template_name):
+        # Reuse the wrapper built on a previous call while the underlying
+        # jinja template is still valid, the same way the jinja environment
+        # cache does (it only checks uptodate when auto_reload is enabled).
+        if self._template_cache is not None:
+            template = self._template_cache.get(template_name)
+            if template is not None:
+                if not self.env.auto_reload or template.template.is_up_to_date:
+                    # Answered before the environment cache is reached.
+                    if self._stats is not None:
+                        self._stats.incr("cache_hits")
+                    return template
+
         if not self.match_template(template_name):
             message = f"Template {template_name} does not exists"
             raise TemplateDoesNotExist(message)
 
+        if self._missing_templates is not None:
+            missing_since = self._missing_templates.get(template_name)
+            if missing_since is not None and (
+                    not self.env.auto_reload or
+                    time.monotonic() - missing_since < self.missing_templates_ttl):
+                raise TemplateDoesNotExist(template_name, backend=self)
+
         try:
-            return Template(self.env.get_template(template_name), self)
+            template = Template(self.env.get_template(template_name), self)
         except jinja2.TemplateNotFound as exc:
             # Unlike django's template engine, jinja2 doesn't like windows-style path separators.
             # But because django does, its docs encourage the usage of os.path.join().
@@ -300,6 +597,9 @@ class Jinja2(BaseEngine):
                 except jinja2.TemplateNotFound:
                     pass
 
+            if self._missing_templates is not None:
+                self._missing_templates[template_name] = time.monotonic()
+
             exc = TemplateDoesNotExist(exc.name, backend=self)
 
             utils.reraise(
@@ -312,6 +612,141 @@ class Jinja2(BaseEngine):
             new.template_debug = get_exception_info(exc)
             utils.reraise(TemplateSyntaxError, new, sys.exc_info()[2])
 
+        if self._template_cache is not None:
+            self._template_cache[template_name] = template
+
+        return template
+
+    def reset(self):
+        """
+        Forget the templates known to be missing and refresh the index of
+        the template loader (when it has one and it is not frozen). Called
+        when the development server detects template changes.
+        """
+        if self._missing_templates is not None:
+            self._missing_templates.clear()
+
+        if not getattr(self._source_loader, "frozen", True):
+            self._source_loader.reset()
+
+    @property
+    def source_loader(self):
+        """
+        The loader of the template sources, without the templates
+        precompiled with the ``compiled_templates`` option.
+        """
+        return self._source_loader
+
+    def compile_templates(self, target, zip=None, log_function=None, ignore_errors=False):
+        """
+        Compile every template matched by this backend into python modules
+        stored in ``target`` (a directory, or a zip file if ``zip`` is set),
+        to be loaded with the ``compiled_templates`` option.
+        """
+        env = self.env.overlay(loader=self._source_loader)
+        env.compile_templates(target,
+                              filter_func=self.match_template,
+                              zip=zip,
+                              log_function=log_function,
+                              ignore_errors=ignore_errors)
+
+    def get_stats(self):
+        """
+        Return the counters and timings of the environment cache, template
+        compilation and bytecode cache of this backend, or None when it is
+        not configured with the ``stats`` option.
+        """
+        if self._stats is None:
+            return None
+
+        result = self._stats.snapshot()
+        result["cache_size"] = len(self.env.cache) if self.env.cache is not None else 0
+        result["cache_capacity"] = getattr(self.env.cache, "capacity", None)
+        return result
+
+    @property
+    def warmup_enabled(self):
+        return self._warmup["enabled"]
+
+    def warmup(self, threads=None):
+        """
+        Load every template matched by this backend into the environment
+        cache, using a pool of threads. Meant to be called at startup (in
+        the master process of pre-forking servers, so the compiled
+        templates are shared by the workers).
+
+        Returns a dict with the number of loaded templates, the names of
+        the templates that failed to load, the number of preloaded static
+        files urls and the elapsed time in seconds.
+        """
+        if threads is None:
+            threads = self._warmup["threads"]
+
+        start = time.perf_counter()
+        try:
+            template_names = [name for name in self._source_loader.list_templates()
+                              if self.match_template(name)]
+        except TypeError:
+            logger.warning("Template warmup skipped: the loader can not list templates.")
+            template_names = []
+
+        # Fetch the stored bytecode of every template at once,
+        # when the bytecode cache supports it.
+        preload = getattr(self.env.bytecode_cache, "preload", None)
+        if preload is not None:
+            preload(self.env, template_names, loader=self._source_loader)
+
+        # Memoize the url of every file of the staticfiles manifest.
+        static_urls = staticfiles.preload_static_urls()
+
+        def _load(template_name):
+            try:
+                self.get_template(template_name)
+            except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+                logger.error("Error loading template %s during warmup: %s", template_name, exc)
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+            loaded = list(executor.map(_load, template_names))
+
+        result = {
+            "templates": sum(loaded),
+            "errors": [name for name, ok in zip(template_names, loaded) if not ok],
+            "static_urls": static_urls,
+            "elapsed": time.perf_counter() - start,
+        }
+
+        logger.info("Loaded %d templates in %.3f seconds.", result["templates"], result["elapsed"])
+        return result
+
+    def get_template_variables(self, template_name):
+        """
+        Return a frozenset with the names of the context variables that the
+        template, and the templates it extends, includes or imports, can read.
+
+        Returns None when some referenced template name is not a string
+        literal and the variables can not be determined statically.
+        """
+        if not self.match_template(template_name):
+            message = f"Template {template_name} does not exists"
+            raise TemplateDoesNotExist(message)
+
+        try:
+            variables, unresolved = base.find_template_variables(
+                self.env, template_name, loader=self._source_loader)
+        except jinja2.TemplateNotFound as exc:
+            exc = TemplateDoesNotExist(exc.name, backend=self)
+            utils.reraise(TemplateDoesNotExist, exc, sys.exc_info()[2])
+        except jinja2.TemplateSyntaxError as exc:
+            new = TemplateSyntaxError(exc.args)
+            new.template_debug = get_exception_info(exc)
+            utils.reraise(TemplateSyntaxError, new, sys.exc_info()[2])
+
+        if unresolved:
+            return None
+        return frozenset(variables)
+
 
 @receiver(signals.setting_changed)
 def _setting_changed(sender, setting, *args, **kwargs):
@@ -3,6 +3,12 @@ import os.path as path
 from importlib import import_module
 
 from django.template.context import BaseContext
+from jinja2 import meta
+
+
+# Name of the context entry that holds the buffer of a streamed render,
+# used by the ``{% flush %}`` tag.
+STREAM_BUFFER_KEY = "__django_jinja_stream_buffer__"
 
 
 def dict_from_context(context):
@@ -107,3 +113,68 @@ def match_template(template_name, extension, regex):
         return re.match(regex, template_name)
     else:
         return True
+
+
+def find_template_variables(environment, template_name, loader=None):
+    """
+    Find the context variables that a template can read, following
+    every template it extends, includes or imports. The sources are
+    read with ``loader`` (the environment loader by default).
+
+    Returns a tuple with the set of variable names (environment globals
+    excluded) and the set of template names that reference other templates
+    with a non literal name, which can not be followed.
+    """
+    variables = set()
+    unresolved = set()
+    seen = set()
+    pending = [template_name]
+
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+
+        source, filename, _ = (loader or environment.loader).get_source(environment, name)
+        ast = environment.parse(source, name, filename)
+        variables.update(meta.find_undeclared_variables(ast))
+
+        for reference in meta.find_referenced_templates(ast):
+            if reference is None:
+                unresolved.add(name)
+            else:
+                pending.append(reference)
+
+    return variables.difference(environment.globals), unresolved
+
+
+class StreamBuffer:
+    """
+    Groups the small chunks generated by a streamed template into chunks
+    of at least ``size`` characters, unless a flush is requested.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.flush_requested = False
+
+    def flush(self):
+        self.flush_requested = True
+
+    def iter_chunks(self, chunks):
+        buffer = []
+        buffered = 0
+
+        for chunk in chunks:
+            buffer.append(chunk)
+            buffered += len(chunk)
+
+            if buffered >= self.size or self.flush_requested:
+                self.flush_requested = False
+                if buffered:
+                    yield "".join(buffer)
+                buffer = []
+                buffered = 0
+
+        if buffered:
+            yield "".join(buffer)
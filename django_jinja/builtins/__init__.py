@@ -5,6 +5,7 @@ DEFAULT_EXTENSIONS = [
     "django_jinja.builtins.extensions.DebugExtension",
     "django_jinja.builtins.extensions.CsrfExtension",
     "django_jinja.builtins.extensions.CacheExtension",
+    "django_jinja.builtins.extensions.FlushExtension",
     "django_jinja.builtins.extensions.TimezoneExtension",
     "django_jinja.builtins.extensions.UrlsExtension",
     "django_jinja.builtins.extensions.StaticFilesExtension",
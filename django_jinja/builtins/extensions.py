@@ -1,20 +1,35 @@
 import logging
 import pprint
+import weakref
 
 from django.conf import settings
 from django.contrib.staticfiles.storage import staticfiles_storage
-from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.urls import NoReverseMatch
-from django.urls import reverse
+from django.urls import get_resolver
+from django.urls import get_script_prefix
+from django.urls import get_urlconf
 from django.utils.encoding import force_str
+from django.utils.translation import get_language
 from jinja2.nodes import ContextReference
 from jinja2 import TemplateSyntaxError
 from jinja2 import pass_context
 from jinja2 import nodes
 from jinja2.ext import Extension
+from jinja2.lexer import Token
+from jinja2.lexer import TokenStream
 from markupsafe import Markup
 
+from ..base import STREAM_BUFFER_KEY
+from ..cache import FragmentCache
+from ..staticfiles import inline_static
+from ..staticfiles import memoizes_urls
+from ..staticfiles import static_url
+from ..urls import UrlBuilder
+from ..urls import reverse
+
 
 JINJA2_MUTE_URLRESOLVE_EXCEPTIONS = getattr(settings, "JINJA2_MUTE_URLRESOLVE_EXCEPTIONS", False)
 logger = logging.getLogger(__name__)
@@ -50,6 +65,28 @@ class CsrfExtension(Extension):
         return ''
 
 
+class FlushExtension(Extension):
+    """
+    A ``{% flush %}`` tag that sends everything rendered so far to the
+    client when the template is streamed with a buffer, for example to
+    send the ``<head>`` while the rest of the page is being computed.
+
+    Outside of buffered streaming it does nothing.
+    """
+    tags = {'flush'}
+
+    def parse(self, parser):
+        lineno = parser.stream.expect('name:flush').lineno
+        call = self.call_method('_flush', [ContextReference()], lineno=lineno)
+        return nodes.Output([call]).set_lineno(lineno)
+
+    def _flush(self, context):
+        buffer = context.get(STREAM_BUFFER_KEY)
+        if buffer is not None:
+            buffer.flush()
+        return ''
+
+
 class CacheExtension(Extension):
     """
     Exactly like Django's own tag, but supports full Jinja2
@@ -61,55 +98,135 @@ class CacheExtension(Extension):
 
     General Syntax:
 
-        {% cache [expire_time] [fragment_name] [var1] [var2] .. %}
+        {% cache [expire_time] [fragment_name] [var1] [var2] .. [tags=[tag1, ..]] %}
             .. some expensive processing ..
         {% endcache %}
 
+    Fragments with tags are invalidated together by the
+    ``invalidate_tags`` method of the environment ``fragment_cache``.
+
+    A ``cache_prefetch`` block fetches the fragments of the given names
+    and ``vary_on`` values (a tuple for each fragment with many of them),
+    and the generations of its tags, with a single query:
+
+        {% cache_prefetch "product", products|map(attribute="pk") tags=["catalog"] %}
+            {% for product in products %}
+                {% cache 600 "product" product.pk tags=["catalog"] %}...{% endcache %}
+            {% endfor %}
+        {% endcache_prefetch %}
+
     Available by default (does not need to be loaded).
 
     Partly based on the ``FragmentCacheExtension`` from the Jinja2 docs.
     """
 
-    tags = {'cache'}
+    tags = {'cache', 'cache_prefetch'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
 
     def parse(self, parser):
-        lineno = next(parser.stream).lineno
+        token = next(parser.stream)
+        lineno = token.lineno
+
+        if token.value == 'cache_prefetch':
+            return self._parse_prefetch(parser, lineno)
 
         expire_time = parser.parse_expression()
         fragment_name = parser.parse_expression()
         vary_on = []
 
+        tags = nodes.List([])
+
         while not parser.stream.current.test('block_end'):
-            vary_on.append(parser.parse_expression())
+            if parser.stream.current.test('name:tags') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                tags = parser.parse_expression()
+            else:
+                vary_on.append(parser.parse_expression())
 
         body = parser.parse_statements(['name:endcache'], drop_needle=True)
 
         return nodes.CallBlock(
             self.call_method('_cache_support',
                              [expire_time, fragment_name,
-                              nodes.List(vary_on), nodes.Const(lineno)]),
+                              nodes.List(vary_on), tags, nodes.Const(lineno),
+                              ContextReference()]),
             [], [], body).set_lineno(lineno)
 
-    def _cache_support(self, expire_time, fragm_name, vary_on, lineno, caller):
+    def _parse_prefetch(self, parser, lineno):
+        fragments = []
+        tags = nodes.List([])
+        parsed = False
+
+        while not parser.stream.current.test('block_end'):
+            if parsed:
+                parser.stream.skip_if('comma')
+            parsed = True
+            if parser.stream.current.test('name:tags') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                tags = parser.parse_expression()
+            else:
+                fragment_name = parser.parse_expression()
+                parser.stream.expect('comma')
+                fragments.append(nodes.Tuple([fragment_name, parser.parse_expression()], 'load'))
+
+        body = parser.parse_statements(['name:endcache_prefetch'], drop_needle=True)
+
+        return nodes.CallBlock(
+            self.call_method('_prefetch_support',
+                             [nodes.List(fragments), tags, ContextReference()]),
+            [], [], body).set_lineno(lineno)
+
+    def _prefetch_support(self, fragments, tags, context, caller):
+        if isinstance(tags, str):
+            tags = [tags]
+        tags = tuple(force_str(tag) for tag in tags or ())
+
+        fragment_cache = self.environment.fragment_cache
+        memo = fragment_cache.get_request_memo(context.get("request"))
+
+        keys = []
+        for fragm_name, vary_on_values in fragments:
+            for vary_on in vary_on_values:
+                if not isinstance(vary_on, (list, tuple)):
+                    vary_on = [vary_on]
+                key = make_template_fragment_key(fragm_name, vary_on)
+                if memo is None or key not in memo:
+                    keys.append(key)
+
+        if self.environment.is_async:
+            return fragment_cache.arender_batch(caller, keys, tags)
+
+        return fragment_cache.render_batch(caller, keys, tags)
+
+    def _cache_support(self, expire_time, fragm_name, vary_on, tags, lineno, context, caller):
         try:
             if expire_time is not None:
                 expire_time = int(expire_time)
         except (ValueError, TypeError):
             raise TemplateSyntaxError(
-                f'"{list(self.tags)[0]}" tag got a non-integer timeout value: {expire_time!r}',
+                f'"cache" tag got a non-integer timeout value: {expire_time!r}',
                 lineno,
             )
 
+        if isinstance(tags, str):
+            tags = [tags]
+        tags = tuple(force_str(tag) for tag in tags or ())
+
         cache_key = make_template_fragment_key(fragm_name, vary_on)
+        fragment_cache = self.environment.fragment_cache
+        memo = fragment_cache.get_request_memo(context.get("request"))
 
-        value = cache.get(cache_key)
-        if value is None:
-            value = caller()
-            cache.set(cache_key, force_str(value), expire_time)
-        else:
-            value = force_str(value)
+        if self.environment.is_async:
+            # In async environments the caller returns a coroutine and
+            # the returned coroutine is awaited by the template.
+            return fragment_cache.aget_or_render(cache_key, expire_time, caller, memo, tags)
 
-        return value
+        return fragment_cache.get_or_render(cache_key, expire_time, caller, memo, tags)
 
 
 class DebugExtension(Extension):
@@ -165,27 +282,32 @@ class StaticFilesExtension(Extension):
     def __init__(self, environment):
         super().__init__(environment)
         environment.globals["static"] = self._static
+        environment.globals["inline_static"] = inline_static
 
     def _static(self, path):
-        return staticfiles_storage.url(path)
+        return static_url(path)
 
 
 class UrlsExtension(Extension):
     def __init__(self, environment):
         super().__init__(environment)
         environment.globals["url"] = self._url_reverse
+        environment.globals["url_builder"] = self._url_builder
 
-    @pass_context
-    def _url_reverse(self, context, name, *args, **kwargs):
+    def _get_current_app(self, context):
         try:
-            current_app = context["request"].current_app
+            return context["request"].current_app
         except AttributeError:
             try:
-                current_app = context["request"].resolver_match.namespace
+                return context["request"].resolver_match.namespace
             except AttributeError:
-                current_app = None
+                return None
         except KeyError:
-            current_app = None
+            return None
+
+    @pass_context
+    def _url_reverse(self, context, name, *args, **kwargs):
+        current_app = self._get_current_app(context)
         try:
             return reverse(name, args=args, kwargs=kwargs, current_app=current_app)
         except NoReverseMatch as exc:
@@ -195,6 +317,198 @@ class UrlsExtension(Extension):
             return ''
         return reverse(name, args=args, kwargs=kwargs)
 
+    @pass_context
+    def _url_builder(self, context, name):
+        """
+        Return a function building urls of the ``name`` view, to reverse
+        many urls of the same view faster:
+
+            {% set product_url = url_builder("product-detail") %}
+            {% for product in products %}{{ product_url(pk=product.pk) }}{% endfor %}
+        """
+        return UrlBuilder(name, current_app=self._get_current_app(context),
+                          silent=JINJA2_MUTE_URLRESOLVE_EXCEPTIONS)
+
+
+class ConstantFoldingExtension(Extension):
+    """
+    Folds the calls of the ``url`` and ``static`` globals whose arguments
+    are all literals, like ``{{ url("home") }}`` or
+    ``{{ static("css/site.css") }}``: their value is resolved on first
+    use and then shared by every render of every template, instead of
+    being resolved on each call.
+
+    Calls are rewritten when the template is compiled, but the values
+    are kept in process memory (not in the compiled code, that may be
+    shared through the bytecode cache), per script prefix and active
+    language. They are resolved again when the url resolver or the
+    staticfiles manifest change, or when a setting changes.
+
+    Urls of namespaced views are not folded, as they depend on the
+    current app of the request, and neither are the calls of templates
+    that bind ``url`` or ``static`` themselves (with ``set``, ``for``,
+    ``with``, imports or macros and their arguments).
+    """
+
+    # Names of the tokens preceding a call that is not a global call.
+    skip_after = {"call", "is"}
+    # Types of the tokens opening and closing a tag.
+    tag_begin = {"block_begin", "linestatement_begin"}
+    tag_end = {"block_end", "linestatement_end"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        self._urls = (None, {})
+        self._statics = (None, {})
+        environment.globals["_folded_url"] = self._folded_url
+        environment.globals["_folded_static"] = self._folded_static
+        _folding_extensions.add(self)
+
+    def filter_stream(self, stream):
+        tokens = list(stream)
+        if self._binds_folded_names(tokens):
+            yield from tokens
+            return
+
+        stream = TokenStream(tokens, stream.name, stream.filename)
+        previous = None
+        while not stream.eos:
+            token = next(stream)
+            if (token.type == "name" and token.value in ("url", "static") and
+                    stream.current.type == "lparen" and not self._is_attribute(previous)):
+                arguments = self._read_arguments(stream)
+                if self._is_foldable(token.value, arguments):
+                    token = Token(token.lineno, "name", f"_folded_{token.value}")
+                yield token
+                yield from arguments
+                previous = arguments[-1]
+                continue
+
+            yield token
+            previous = token
+
+    def _binds_folded_names(self, tokens):
+        # Names in tags that are not calls nor attributes may be bound by
+        # the template, e.g. {% set url = ... %} or {% for static in ... %}.
+        in_tag = False
+        for position, token in enumerate(tokens):
+            if token.type in self.tag_begin:
+                in_tag = True
+            elif token.type in self.tag_end:
+                in_tag = False
+            elif in_tag and token.type == "name" and token.value in ("url", "static"):
+                previous = tokens[position - 1]
+                following = tokens[position + 1] if position + 1 < len(tokens) else None
+                if previous.type in ("dot", "pipe") or previous.test("name:is"):
+                    continue
+                if (following is not None and following.type == "lparen" and
+                        not previous.test("name:macro")):
+                    continue
+                return True
+        return False
+
+    def _is_attribute(self, previous):
+        if previous is None:
+            return False
+        if previous.type in ("dot", "pipe"):
+            return True
+        return previous.type == "name" and previous.value in self.skip_after
+
+    def _read_arguments(self, stream):
+        # Tokens from the opening to the matching closing parenthesis.
+        tokens = []
+        depth = 0
+        while not stream.eos:
+            token = next(stream)
+            tokens.append(token)
+            if token.type in ("lparen", "lbracket", "lbrace"):
+                depth += 1
+            elif token.type in ("rparen", "rbracket", "rbrace"):
+                depth -= 1
+                if depth == 0:
+                    break
+        return tokens
+
+    def _is_foldable(self, function, tokens):
+        inner = tokens[1:-1]
+        if not inner or inner[0].type != "string" or tokens[-1].type != "rparen":
+            return False
+        if function == "url" and ":" in inner[0].value:
+            return False
+
+        # Literal positional arguments followed by literal keyword arguments.
+        position = 0
+        while position < len(inner):
+            if inner[position].type == "name":
+                if position + 1 >= len(inner) or inner[position + 1].type != "assign":
+                    return False
+                position += 2
+            if position >= len(inner) or inner[position].type not in ("string", "integer"):
+                return False
+            position += 1
+            if position < len(inner):
+                if inner[position].type != "comma":
+                    return False
+                position += 1
+        return True
+
+    def _get_values(self, attribute, state, key=None):
+        current_state, values = getattr(self, attribute)
+        if current_state is None or any(a is not b for a, b in zip(state, current_state)):
+            values = {}
+            setattr(self, attribute, (state, values))
+        try:
+            return values[key]
+        except KeyError:
+            return values.setdefault(key, {})
+
+    def clear(self):
+        self._urls = (None, {})
+        self._statics = (None, {})
+
+    def _folded_url(self, name, *args, **kwargs):
+        urlconf = get_urlconf()
+        values = self._get_values("_urls", (get_resolver(urlconf),),
+                                  (get_script_prefix(), get_language()))
+
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            return values[key]
+        except KeyError:
+            pass
+
+        try:
+            value = reverse(name, urlconf=urlconf, args=args, kwargs=kwargs)
+        except NoReverseMatch as exc:
+            logger.error('Error: %s', exc)
+            if not JINJA2_MUTE_URLRESOLVE_EXCEPTIONS:
+                raise
+            value = ''
+
+        values[key] = value
+        return value
+
+    def _folded_static(self, path):
+        if not memoizes_urls():
+            return staticfiles_storage.url(path)
+
+        state = (getattr(staticfiles_storage, "hashed_files", None),)
+        values = self._get_values("_statics", state)
+        try:
+            return values[path]
+        except KeyError:
+            value = values[path] = staticfiles_storage.url(path)
+            return value
+
+
+_folding_extensions = weakref.WeakSet()
+
+
+@receiver(setting_changed)
+def _clear_folded_values(**kwargs):
+    for extension in list(_folding_extensions):
+        extension.clear()
+
 
 from . import filters
 
@@ -1,6 +1,9 @@
 from django.utils.encoding import force_str
-from django.urls import reverse as django_reverse
-from django.contrib.staticfiles.storage import staticfiles_storage
+
+from ..dateformat import date_format
+from ..dateformat import time_format
+from ..staticfiles import static_url
+from ..urls import reverse as cached_reverse
 
 
 def reverse(value, *args, **kwargs):
@@ -15,10 +18,10 @@ def reverse(value, *args, **kwargs):
         {% url 'web:timeline' userid=2 %}
 
     """
-    return django_reverse(value, args=args, kwargs=kwargs)
+    return cached_reverse(value, args=args, kwargs=kwargs)
 
 def static(path):
-    return staticfiles_storage.url(path)
+    return static_url(path)
 
 
 from django.template.defaultfilters import addslashes
@@ -53,8 +56,8 @@ from django.template.defaultfilters import join
 from django.template.defaultfilters import length
 from django.template.defaultfilters import random
 from django.template.defaultfilters import add
-from django.template.defaultfilters import date
-from django.template.defaultfilters import time
+from django.template.defaultfilters import date as django_date
+from django.template.defaultfilters import time as django_time
 from django.template.defaultfilters import timesince_filter
 from django.template.defaultfilters import timeuntil_filter
 from django.template.defaultfilters import default
@@ -74,6 +77,33 @@ def slugify(value):
 from functools import partial
 linebreaksbr = partial(linebreaksbr, autoescape=True)
 
+# Dates
+
+def date(value, arg=None):
+    """
+    Same as the django ``date`` filter, reusing the compiled format
+    of each format string and language.
+    """
+    if value in (None, ""):
+        return ""
+    try:
+        return date_format(value, arg)
+    except AttributeError:
+        # Not a date: the django filter gives the fallback value.
+        return django_date(value, arg)
+
+def time(value, arg=None):
+    """
+    Same as the django ``time`` filter, reusing the compiled format
+    of each format string and language.
+    """
+    if value in (None, ""):
+        return ""
+    try:
+        return time_format(value, arg)
+    except (AttributeError, TypeError):
+        return django_time(value, arg)
+
 # TZ
 
 from django.templatetags.tz import do_timezone as timezone
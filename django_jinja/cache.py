@@ -1,26 +1,944 @@
+import asyncio
+import contextvars
+import marshal
+import math
+import mmap
+import os
+import pickle
+import random
+import stat
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from hashlib import md5
+from hashlib import sha1
+from importlib import metadata
+
+from asgiref.sync import sync_to_async
 from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_str
 from django.utils.functional import cached_property
 from jinja2 import BytecodeCache as _BytecodeCache
+from jinja2 import TemplateNotFound
+from jinja2.bccache import Bucket
+from jinja2.bccache import bc_magic
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_version_tag():
+    """
+    Identify the interpreter, Jinja2 and django-jinja versions, which
+    determine whether stored bytecode can be used.
+    """
+    return "|".join([
+        sys.implementation.cache_tag or sys.implementation.name,
+        _package_version("jinja2"),
+        _package_version("django-jinja"),
+    ])
+
+
+def _compress(data, method):
+    if method == "zlib":
+        return b"zlib:" + zlib.compress(data)
+
+    import lzma
+    return b"lzma:" + lzma.compress(data)
+
+
+def _decompress(value):
+    if value.startswith(b"zlib:"):
+        return zlib.decompress(value[5:])
+    if value.startswith(b"lzma:"):
+        import lzma
+        return lzma.decompress(value[5:])
+    return value
+
+
+class MemoryCache:
+    """
+    A thread safe in-process LRU cache, bounded by number of entries
+    and by the total size of the stored values (as given on ``set``).
+    """
+
+    def __init__(self, max_entries=None, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=0):
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            self._data[key] = (value, size)
+            self.size += size
+
+            while ((self.max_entries is not None and len(self._data) > self.max_entries) or
+                   (self.max_size is not None and self.size > self.max_size)):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.size -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
 
 
 class BytecodeCache(_BytecodeCache):
     """
     A bytecode cache for Jinja2 that uses Django's caching framework.
+
+    Keys depend on the interpreter, Jinja2 and django-jinja versions and
+    on the template name and source (not on its filename), so processes
+    running the same build share entries, wherever it is deployed, and
+    processes running different builds never read them.
+
+    Bytecode of at least ``compress_min_size`` bytes can be compressed
+    with ``zlib`` or ``lzma`` (the ``compress`` argument).
     """
 
-    def __init__(self, cache_name):
+    compressors = ("zlib", "lzma")
+
+    def __init__(self, cache_name, compress=None, compress_min_size=1024):
+        if compress is not None and compress not in self.compressors:
+            raise ImproperlyConfigured(f"Unsupported bytecode compression: {compress}")
+
         self._cache_name = cache_name
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.sizes = {}
 
     @cached_property
     def backend(self):
         return caches[self._cache_name]
 
+    @cached_property
+    def version_tag(self):
+        return get_version_tag()
+
+    def get_bucket_key(self, name, filename, checksum):
+        return sha1(f"{self.version_tag}|{name}|{checksum}".encode("utf-8")).hexdigest()
+
+    def make_bucket(self, environment, name, filename, source):
+        checksum = self.get_source_checksum(source)
+        bucket = Bucket(environment, self.get_bucket_key(name, filename, checksum), checksum)
+        bucket.name = name
+        return bucket
+
+    def get_bucket(self, environment, name, filename, source):
+        bucket = self.make_bucket(environment, name, filename, source)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def get_backend_key(self, bucket):
+        return f'jinja2_{str(bucket.key)}'
+
+    def encode(self, bucket):
+        """
+        Return the bytecode of the bucket as stored in the cache,
+        compressed when it is large enough.
+        """
+        bytecode = bucket.bytecode_to_string()
+        value = bytecode
+
+        if self.compress is not None and len(bytecode) >= self.compress_min_size:
+            value = _compress(bytecode, self.compress)
+
+        self._record_sizes(bucket, len(bytecode), len(value))
+        return bytecode, value
+
+    def decode(self, bucket, value):
+        """
+        Return the bytecode from a value stored in the cache.
+        """
+        bytecode = _decompress(value)
+        self._record_sizes(bucket, len(bytecode), len(value))
+        return bytecode
+
+    def _record_sizes(self, bucket, size, stored_size):
+        self.sizes[getattr(bucket, "name", bucket.key)] = {
+            "size": size,
+            "stored_size": stored_size,
+        }
+
+    def size_stats(self):
+        """
+        Return the bytecode size and the stored (maybe compressed) size
+        of each template loaded from or written to the cache.
+        """
+        return dict(self.sizes)
+
     def load_bytecode(self, bucket):
-        key = f'jinja2_{str(bucket.key)}'
+        key = self.get_backend_key(bucket)
+        value = self.backend.get(key)
+        if value:
+            bucket.bytecode_from_string(self.decode(bucket, value))
+
+    def dump_bytecode(self, bucket):
+        key = self.get_backend_key(bucket)
+        _, value = self.encode(bucket)
+        self.backend.set(key, value)
+
+
+class TwoTierBytecodeCache(BytecodeCache):
+    """
+    A bytecode cache that keeps the most recently used template code in
+    process memory (bounded by number of entries and total bytecode size)
+    in front of Django's caching framework, so repeated loads skip the
+    network round trip and the unmarshalling of the bytecode.
+    """
+
+    def __init__(self, cache_name, max_entries=400, max_size=64 * 1024 * 1024, **kwargs):
+        super().__init__(cache_name, **kwargs)
+        self.local = MemoryCache(max_entries=max_entries, max_size=max_size)
+        self.counters = dict.fromkeys(("l1_hits", "l1_misses", "l2_hits", "l2_misses"), 0)
+
+    def stats(self):
+        """
+        Return the hit and miss counters of each tier, with the number
+        of entries and total bytecode size held in process memory.
+        """
+        return dict(self.counters, l1_entries=len(self.local), l1_size=self.local.size)
+
+    def load_bytecode(self, bucket):
+        key = self.get_backend_key(bucket)
+
+        entry = self.local.get(key)
+        if entry is not None and entry[0] == bucket.checksum:
+            self.counters["l1_hits"] += 1
+            bucket.code = entry[1]
+            return
+
+        self.counters["l1_misses"] += 1
         bytecode = self.backend.get(key)
         if bytecode:
+            bytecode = self.decode(bucket, bytecode)
             bucket.bytecode_from_string(bytecode)
 
+        if bucket.code is None:
+            self.counters["l2_misses"] += 1
+        else:
+            self.counters["l2_hits"] += 1
+            self.local.set(key, (bucket.checksum, bucket.code), len(bytecode))
+
     def dump_bytecode(self, bucket):
-        key = f'jinja2_{str(bucket.key)}'
-        self.backend.set(key, bucket.bytecode_to_string())
+        key = self.get_backend_key(bucket)
+        bytecode, value = self.encode(bucket)
+        self.backend.set(key, value)
+        self.local.set(key, (bucket.checksum, bucket.code), len(bytecode))
+
+    def preload(self, environment, template_names, loader=None):
+        """
+        Fetch the bytecode of the given templates from the django cache
+        with a single ``get_many`` call and keep it in process memory.
+        Returns the number of templates found.
+        """
+        if loader is None:
+            loader = environment.loader
+
+        buckets = {}
+        for name in template_names:
+            try:
+                source, filename, _ = loader.get_source(environment, name)
+            except TemplateNotFound:
+                continue
+
+            bucket = self.make_bucket(environment, name, filename, source)
+            buckets[self.get_backend_key(bucket)] = bucket
+
+        found = 0
+        for key, bytecode in self.backend.get_many(list(buckets)).items():
+            bucket = buckets[key]
+            bytecode = self.decode(bucket, bytecode)
+            bucket.bytecode_from_string(bytecode)
+            if bucket.code is not None:
+                self.local.set(key, (bucket.checksum, bucket.code), len(bytecode))
+                found += 1
+
+        return found
+
+    def clear(self):
+        self.local.clear()
+
+
+class MmapBytecodeCache(BytecodeCache):
+    """
+    A bytecode cache that stores each template in a file of a directory
+    shared by all the processes of a host. Files are written atomically
+    (to a temporary file renamed over the final one) and read through
+    memory maps without locks, so processes share the same on-disk copy
+    without any network I/O.
+
+    Since keys depend on the template source and on the versions of the
+    interpreter and libraries, concurrent writers of the same key always
+    write the same content, and the last rename wins.
+    """
+
+    def __init__(self, cache_name="default", directory=None):
+        super().__init__(cache_name)
+        if directory is None:
+            directory = self._get_default_directory(cache_name)
+        else:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        self.directory = directory
+
+    def _get_default_directory(self, cache_name):
+        """
+        Return a directory of the temp dir private to the current user,
+        checked like jinja's ``FileSystemBytecodeCache`` does, as another
+        user able to write bytecode there could run code in this process.
+        """
+        tmpdir = tempfile.gettempdir()
+        if os.name == "nt":
+            # The temp dir is private to the user on windows.
+            directory = os.path.join(tmpdir, f"django-jinja-bytecode-{cache_name}")
+            os.makedirs(directory, exist_ok=True)
+            return directory
+
+        if not hasattr(os, "getuid"):
+            raise ImproperlyConfigured(
+                "Cannot determine a safe bytecode cache directory, set it explicitly.")
+
+        uid = os.getuid()
+        directory = os.path.join(tmpdir, f"django-jinja-bytecode-{uid}-{cache_name}")
+        try:
+            os.mkdir(directory, stat.S_IRWXU)
+        except FileExistsError:
+            pass
+
+        st = os.lstat(directory)
+        if (st.st_uid != uid or not stat.S_ISDIR(st.st_mode) or
+                stat.S_IMODE(st.st_mode) != stat.S_IRWXU):
+            raise ImproperlyConfigured(
+                f"The bytecode cache directory {directory} is not a private directory of "
+                f"the current user, set a safe one explicitly.")
+        return directory
+
+    def get_filename(self, bucket):
+        return os.path.join(self.directory, f"{self.get_backend_key(bucket)}.cache")
+
+    def load_bytecode(self, bucket):
+        try:
+            with open(self.get_filename(bucket), "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self._load_mapped_bytecode(bucket, data)
+        except (OSError, ValueError):
+            # Missing file, or an empty one that can not be mapped.
+            bucket.reset()
+
+    def _load_mapped_bytecode(self, bucket, data):
+        # Same format as Bucket.load_bytecode, but the code is unmarshalled
+        # straight from the mapped memory instead of a file object.
+        if data.read(len(bc_magic)) != bc_magic:
+            return
+
+        try:
+            if pickle.load(data) != bucket.checksum:
+                return
+
+            with memoryview(data) as view, view[data.tell():] as code:
+                bucket.code = marshal.loads(code)
+        except (EOFError, ValueError, TypeError, pickle.UnpicklingError):
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        fd, tmp = tempfile.mkstemp(prefix="tmp-", suffix=".cache", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                bucket.write_bytecode(f)
+            os.replace(tmp, self.get_filename(bucket))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".cache"):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+
+# Prefetch batch of the ``{% cache_prefetch %}`` block being rendered.
+_fragment_batch = contextvars.ContextVar("django_jinja_fragment_batch", default=None)
+
+
+class FragmentBatch:
+    """
+    Prefetched values, rendered entries and pending writes of the
+    fragments rendered inside a ``{% cache_prefetch %}`` block.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.fetched = set()
+        self.found = {}
+        self.pending = {}
+
+    def add(self, key, entry, timeout):
+        self.found[key] = (entry, entry[3])
+        self.pending.setdefault(timeout, {})[key] = entry
+
+
+class FragmentCache:
+    """
+    Storage of the fragments rendered by the ``{% cache %}`` tag, in the
+    ``cache_name`` Django cache.
+
+    With a ``grace_time``, fragments are kept that many seconds after
+    they expire. A request finding an expired fragment recomputes it
+    under a cache lock while concurrent requests keep serving the stale
+    value, and requests missing a fragment being computed wait up to
+    ``lock_wait`` seconds for it. Fragments are also recomputed early,
+    with a probability growing as expiry approaches and scaled by the
+    ``early_recompute`` factor, to spread recomputations over time.
+
+    With ``request_memo`` enabled, fragments are also kept in memory for
+    the duration of the request, so that a fragment rendered many times
+    in a request is fetched once.
+
+    Fragments of at least ``compress_min_size`` bytes can be compressed
+    with ``zlib`` or ``lzma`` (the ``compress`` argument), and with
+    ``local_max_entries`` the most recently used fragments are kept in
+    process memory (bounded by number of entries and total size, and for
+    at most ``local_timeout`` seconds) in front of the Django cache.
+
+    Fragments can depend on tags, each with a generation counter stored
+    in the cache and fetched along with the fragments. Fragments stored
+    with an older generation of one of their tags are ignored, so
+    ``invalidate_tags`` invalidates all of them at once.
+    """
+
+    compressors = BytecodeCache.compressors
+
+    def __init__(self, cache_name="default", grace_time=0, lock_timeout=30, lock_wait=5,
+                 early_recompute=1.0, request_memo=True, compress=None, compress_min_size=1024,
+                 local_max_entries=None, local_max_size=8 * 1024 * 1024, local_timeout=60):
+        if compress is not None and compress not in self.compressors:
+            raise ImproperlyConfigured(f"Unsupported fragment compression: {compress}")
+
+        self._cache_name = cache_name
+        self.grace_time = grace_time
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.early_recompute = early_recompute
+        self.request_memo = request_memo
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        self.local_timeout = local_timeout
+        self.local = None
+        # Last known generation of the most recently used tags, to check
+        # local entries (local entries of other tags are refetched).
+        self._generations = None
+        if local_max_entries:
+            self.local = MemoryCache(max_entries=local_max_entries, max_size=local_max_size)
+            self._generations = MemoryCache(max_entries=4 * local_max_entries)
+        self._request_memos = weakref.WeakKeyDictionary()
+
+    @property
+    def backend(self):
+        return caches[self._cache_name]
+
+    def get_request_memo(self, request):
+        """
+        Return the fragments already used by ``request``, or None when
+        the memo is disabled or there is no request.
+        """
+        if not self.request_memo or request is None:
+            return None
+
+        try:
+            return self._request_memos.setdefault(request, {})
+        except TypeError:
+            # The request object does not support weak references.
+            return None
+
+    def clear(self):
+        """
+        Clear the fragments kept in process memory.
+        """
+        if self.local is not None:
+            self.local.clear()
+
+    def get_tag_key(self, tag):
+        return f"template.cache_tag.{md5(tag.encode('utf-8')).hexdigest()}"
+
+    def _new_generation(self):
+        # Unique among processes, so that a lost generation counter
+        # never validates fragments stored before it was lost.
+        return time.time_ns()
+
+    def invalidate_tags(self, *tags):
+        """
+        Invalidate all the fragments depending on any of ``tags``.
+        """
+        for tag in tags:
+            key = self.get_tag_key(tag)
+            try:
+                generation = self.backend.incr(key)
+            except ValueError:
+                generation = self._new_generation()
+                self.backend.set(key, generation, None)
+            self._set_generations([tag], [generation])
+
+    async def ainvalidate_tags(self, *tags):
+        """
+        Async version of ``invalidate_tags``.
+        """
+        for tag in tags:
+            key = self.get_tag_key(tag)
+            try:
+                generation = await self._call_async("incr", key)
+            except ValueError:
+                generation = self._new_generation()
+                await self._call_async("set", key, generation, None)
+            self._set_generations([tag], [generation])
+
+    def _set_generations(self, tags, generations):
+        if self._generations is not None:
+            for tag, generation in zip(tags, generations):
+                self._generations.set(tag, generation)
+
+    def _read_generations(self, tags, found):
+        generations = tuple(found[self.get_tag_key(tag)] for tag in tags)
+        self._set_generations(tags, generations)
+        return generations
+
+    def _get_generations(self, tags, found):
+        """
+        Return the generations of ``tags`` from the values ``found`` in
+        the cache, creating the missing ones.
+        """
+        for tag in tags:
+            key = self.get_tag_key(tag)
+            if found.get(key) is None:
+                self.backend.add(key, self._new_generation(), None)
+                found[key] = self.backend.get(key)
+        return self._read_generations(tags, found)
+
+    async def _aget_generations(self, tags, found):
+        for tag in tags:
+            key = self.get_tag_key(tag)
+            if found.get(key) is None:
+                await self._call_async("add", key, self._new_generation(), None)
+                found[key] = await self._call_async("get", key)
+        return self._read_generations(tags, found)
+
+    def _get_timeout(self, timeout):
+        if timeout is None or timeout <= 0:
+            return timeout
+        return timeout + self.grace_time
+
+    def _encode(self, value):
+        if self.compress is not None:
+            data = value.encode("utf-8")
+            if len(data) >= self.compress_min_size:
+                return _compress(data, self.compress)
+        return value
+
+    def _decode(self, value):
+        if isinstance(value, bytes):
+            return _decompress(value).decode("utf-8")
+        return force_str(value)
+
+    def _make_entry(self, value, timeout, delta, generations):
+        fresh_until = time.time() + timeout if timeout and self.grace_time else None
+        return (value, fresh_until, delta, generations)
+
+    def _dump(self, entry):
+        """
+        Return a ``(value, fresh_until, delta, generations)`` entry as
+        stored in the Django cache.
+        """
+        value = self._encode(entry[0])
+        if not self.grace_time and not entry[3]:
+            return value
+        return (value,) + entry[1:]
+
+    def _load(self, stored):
+        """
+        Return the ``(value, fresh_until, delta, generations)`` entry of
+        a stored fragment, or None when missing.
+        """
+        if stored is None:
+            return None
+        if isinstance(stored, tuple):
+            value, fresh_until, delta, *generations = stored
+            generations = generations[0] if generations else ()
+        else:
+            # Values stored without grace time are considered expired
+            # once a grace time is configured.
+            value, fresh_until, delta, generations = stored, 0 if self.grace_time else None, 0, ()
+        return (self._decode(value), fresh_until, delta, generations)
+
+    def _is_stale(self, entry):
+        _, fresh_until, delta, _ = entry
+        if fresh_until is None:
+            return False
+
+        now = time.time()
+        if self.early_recompute and delta:
+            # Probabilistic early expiration ("XFetch").
+            now -= delta * self.early_recompute * math.log(1.0 - random.random())
+        return now >= fresh_until
+
+    def _get_local_entry(self, key):
+        """
+        Return the unexpired local entry of ``key``, whatever the
+        generations of its tags.
+        """
+        if self.local is None:
+            return None
+
+        item = self.local.get(key)
+        if item is None or item[1] <= time.monotonic():
+            return None
+
+        entry = item[0]
+        if entry[1] is not None and entry[1] <= time.time():
+            # Expired fragments may have been recomputed elsewhere.
+            return None
+        return entry
+
+    def _get_local(self, key, tags):
+        entry = self._get_local_entry(key)
+        if entry is None or entry[3] != tuple(self._generations.get(tag) for tag in tags):
+            return None
+        return entry
+
+    def _set_local(self, key, entry, timeout=None):
+        if self.local is None or (timeout is not None and timeout <= 0):
+            return
+
+        local_timeout = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        item = (entry, time.monotonic() + local_timeout)
+        self.local.set(key, item, len(entry[0]))
+
+    def _loaded(self, key, stored, generations=()):
+        entry = self._load(stored)
+        if entry is None or entry[3] != generations:
+            # Missing, or invalidated by one of its tags.
+            return None
+
+        self._set_local(key, entry)
+        return entry
+
+    def _stored(self, key, entry, timeout):
+        self._set_local(key, entry, timeout)
+        return self._dump(entry)
+
+    def _render(self, render, timeout, generations):
+        start = time.monotonic()
+        value = force_str(render())
+        return self._make_entry(value, timeout, time.monotonic() - start, generations)
+
+    async def _arender(self, render, timeout, generations):
+        start = time.monotonic()
+        value = force_str(await render())
+        return self._make_entry(value, timeout, time.monotonic() - start, generations)
+
+    def _get_entry(self, key, tags):
+        """
+        Return the entry stored under ``key`` (or None) and the current
+        generations of ``tags``, fetched in the same query.
+        """
+        entry = self._get_local(key, tags)
+        if entry is not None:
+            return entry, entry[3]
+
+        if not tags:
+            return self._loaded(key, self.backend.get(key)), ()
+
+        found = self.backend.get_many([key] + [self.get_tag_key(tag) for tag in tags])
+        generations = self._get_generations(tags, found)
+        return self._loaded(key, found.get(key), generations), generations
+
+    def _set_entry(self, key, entry, timeout):
+        self.backend.set(key, self._stored(key, entry, timeout), self._get_timeout(timeout))
+
+    def _get_prefetch_keys(self, batch, keys, tags, skip_local=True):
+        # Tags of the prefetched fragments are not known yet: fragments
+        # with a local entry are skipped whatever its generations, and
+        # fetched on demand if they are invalid.
+        keys = [key for key in dict.fromkeys(keys) if key not in batch.fetched and
+                not (skip_local and self._get_local_entry(key) is not None)]
+        return keys + sorted({self.get_tag_key(tag) for tag in tags} - batch.fetched)
+
+    def _prefetch(self, batch, keys, tags=(), skip_local=True):
+        """
+        Fetch the fragments stored under ``keys`` and the generations of
+        ``tags`` into ``batch``, with a single query for all of them.
+        """
+        keys = self._get_prefetch_keys(batch, keys, tags, skip_local)
+        if keys:
+            batch.values.update(self.backend.get_many(keys))
+            batch.fetched.update(keys)
+
+    def _get_batch_entry(self, key, tags, batch):
+        """
+        Same as ``_get_entry``, using the values prefetched by ``batch``
+        and fetching the missing ones into it.
+        """
+        if key in batch.found:
+            return batch.found[key]
+
+        entry = self._get_local(key, tags)
+        if entry is not None:
+            return entry, entry[3]
+
+        self._prefetch(batch, [key], tags, skip_local=False)
+        generations = self._get_generations(tags, batch.values)
+        return self._loaded(key, batch.values.get(key), generations), generations
+
+    def _set_entries(self, entries, timeout):
+        values = {key: self._stored(key, entry, timeout) for key, entry in entries.items()}
+        self.backend.set_many(values, self._get_timeout(timeout))
+
+    def get_or_render(self, key, timeout, render, memo=None, tags=()):
+        """
+        Return the fragment stored under ``key``, calling ``render`` to
+        compute (and store) it when it is missing, expired or invalidated
+        by one of its ``tags``. Fragments found in ``memo`` (a request
+        memo) are not looked up again.
+        """
+        if memo is not None and key in memo:
+            return memo[key]
+
+        value = self._get_or_render(key, timeout, render, tags, _fragment_batch.get())
+        if memo is not None and (timeout is None or timeout > 0):
+            memo[key] = value
+        return value
+
+    def _get_or_render(self, key, timeout, render, tags, batch):
+        if batch is not None:
+            entry, generations = self._get_batch_entry(key, tags, batch)
+        else:
+            entry, generations = self._get_entry(key, tags)
+
+        if entry is not None and not self._is_stale(entry):
+            return entry[0]
+
+        if batch is not None and entry is None:
+            # Misses of a prefetch block are stored at once when it ends.
+            entry = self._render(render, timeout, generations)
+            batch.add(key, entry, timeout)
+            return entry[0]
+
+        if not self.grace_time:
+            entry = self._render(render, timeout, generations)
+            self._set_entry(key, entry, timeout)
+            return entry[0]
+
+        lock_key = f"{key}.lock"
+        if self.backend.add(lock_key, 1, self.lock_timeout):
+            try:
+                entry = self._render(render, timeout, generations)
+                self._set_entry(key, entry, timeout)
+                return entry[0]
+            finally:
+                self.backend.delete(lock_key)
+
+        if entry is not None:
+            # Another request is recomputing the fragment.
+            return entry[0]
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry, generations = self._get_entry(key, tags)
+            if entry is not None:
+                return entry[0]
+
+        entry = self._render(render, timeout, generations)
+        self._set_entry(key, entry, timeout)
+        return entry[0]
+
+    def render_batch(self, render, keys=(), tags=()):
+        """
+        Render the body of a ``{% cache_prefetch %}`` block, once the
+        fragments stored under ``keys`` and the generations of ``tags``
+        are fetched with a single ``get_many``. The fragments of the
+        block missing from the cache are stored with a ``set_many`` by
+        timeout when it ends.
+        """
+        batch = _fragment_batch.get()
+        if batch is not None:
+            # Nested blocks are part of the enclosing batch.
+            self._prefetch(batch, keys, tags)
+            return render()
+
+        batch = FragmentBatch()
+        self._prefetch(batch, keys, tags)
+        token = _fragment_batch.set(batch)
+        try:
+            result = render()
+        finally:
+            _fragment_batch.reset(token)
+
+        for timeout, entries in batch.pending.items():
+            self._set_entries(entries, timeout)
+        return result
+
+    async def _call_async(self, method, *args):
+        # Django < 4.0 has no async cache API.
+        amethod = getattr(self.backend, f"a{method}", None)
+        if amethod is None:
+            return await sync_to_async(getattr(self.backend, method))(*args)
+        return await amethod(*args)
+
+    async def _aget_entry(self, key, tags):
+        entry = self._get_local(key, tags)
+        if entry is not None:
+            return entry, entry[3]
+
+        if not tags:
+            return self._loaded(key, await self._call_async("get", key)), ()
+
+        found = await self._call_async("get_many", [key] + [self.get_tag_key(tag) for tag in tags])
+        generations = await self._aget_generations(tags, found)
+        return self._loaded(key, found.get(key), generations), generations
+
+    async def _aset_entry(self, key, entry, timeout):
+        stored = self._stored(key, entry, timeout)
+        await self._call_async("set", key, stored, self._get_timeout(timeout))
+
+    async def _aprefetch(self, batch, keys, tags=(), skip_local=True):
+        keys = self._get_prefetch_keys(batch, keys, tags, skip_local)
+        if keys:
+            batch.values.update(await self._call_async("get_many", keys))
+            batch.fetched.update(keys)
+
+    async def _aget_batch_entry(self, key, tags, batch):
+        if key in batch.found:
+            return batch.found[key]
+
+        entry = self._get_local(key, tags)
+        if entry is not None:
+            return entry, entry[3]
+
+        await self._aprefetch(batch, [key], tags, skip_local=False)
+        generations = await self._aget_generations(tags, batch.values)
+        return self._loaded(key, batch.values.get(key), generations), generations
+
+    async def _aset_entries(self, entries, timeout):
+        values = {key: self._stored(key, entry, timeout) for key, entry in entries.items()}
+        await self._call_async("set_many", values, self._get_timeout(timeout))
+
+    async def aget_or_render(self, key, timeout, render, memo=None, tags=()):
+        """
+        Async version of ``get_or_render``, where ``render`` returns
+        an awaitable.
+        """
+        if memo is not None and key in memo:
+            return memo[key]
+
+        value = await self._aget_or_render(key, timeout, render, tags, _fragment_batch.get())
+        if memo is not None and (timeout is None or timeout > 0):
+            memo[key] = value
+        return value
+
+    async def _aget_or_render(self, key, timeout, render, tags, batch):
+        if batch is not None:
+            entry, generations = await self._aget_batch_entry(key, tags, batch)
+        else:
+            entry, generations = await self._aget_entry(key, tags)
+
+        if entry is not None and not self._is_stale(entry):
+            return entry[0]
+
+        if batch is not None and entry is None:
+            entry = await self._arender(render, timeout, generations)
+            batch.add(key, entry, timeout)
+            return entry[0]
+
+        if not self.grace_time:
+            entry = await self._arender(render, timeout, generations)
+            await self._aset_entry(key, entry, timeout)
+            return entry[0]
+
+        lock_key = f"{key}.lock"
+        if await self._call_async("add", lock_key, 1, self.lock_timeout):
+            try:
+                entry = await self._arender(render, timeout, generations)
+                await self._aset_entry(key, entry, timeout)
+                return entry[0]
+            finally:
+                await self._call_async("delete", lock_key)
+
+        if entry is not None:
+            return entry[0]
+
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry, generations = await self._aget_entry(key, tags)
+            if entry is not None:
+                return entry[0]
+
+        entry = await self._arender(render, timeout, generations)
+        await self._aset_entry(key, entry, timeout)
+        return entry[0]
+
+    async def arender_batch(self, render, keys=(), tags=()):
+        """
+        Async version of ``render_batch``.
+        """
+        batch = _fragment_batch.get()
+        if batch is not None:
+            await self._aprefetch(batch, keys, tags)
+            return await render()
+
+        batch = FragmentBatch()
+        await self._aprefetch(batch, keys, tags)
+        token = _fragment_batch.set(batch)
+        try:
+            result = await render()
+        finally:
+            _fragment_batch.reset(token)
+
+        for timeout, entries in batch.pending.items():
+            await self._aset_entries(entries, timeout)
+        return result
@@ -1,5 +1,10 @@
+from datetime import date
+from datetime import datetime
+
 from django.contrib.humanize.templatetags import humanize
+from django.utils.translation import gettext as _
 from django_jinja import library
+from django_jinja.builtins.filters import date as date_filter
 
 
 @library.filter
@@ -24,7 +29,25 @@ def apnumber(source):
 
 @library.filter
 def naturalday(source, arg=None):
-    return humanize.naturalday(source, arg)
+    """
+    Same as django's ``naturalday``, formatting the other days with the
+    compiled formats of the ``date`` filter.
+    """
+    tzinfo = getattr(source, "tzinfo", None)
+    try:
+        value = date(source.year, source.month, source.day)
+    except AttributeError:
+        # Passed value wasn't a date object
+        return source
+
+    delta = value - datetime.now(tzinfo).date()
+    if delta.days == 0:
+        return _("today")
+    elif delta.days == 1:
+        return _("tomorrow")
+    elif delta.days == -1:
+        return _("yesterday")
+    return date_filter(value, arg)
 
 
 @library.filter
@@ -0,0 +1,122 @@
+"""
+Compiled date formats for the ``date`` and ``time`` filters.
+
+``django.utils.formats.date_format`` looks up the localized format and
+parses it on every call. Here each format (and the active language it
+was looked up with) is compiled once into a ``CompiledFormat``, which
+keeps the literal parts of the format and the ``DateFormat`` methods of
+its specifiers, and is kept in a bounded LRU cleared on every
+``setting_changed`` signal. The timezone of the value is only resolved
+by formats with timezone specifiers.
+
+The size of the cache is set by the ``JINJA2_DATE_FORMAT_CACHE_SIZE``
+setting (``0`` disables it).
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.dateformat import DateFormat
+from django.utils.dateformat import TimeFormat
+from django.utils.dateformat import re_escaped
+from django.utils.dateformat import re_formatchars
+from django.utils.formats import get_format
+from django.utils.translation import get_language
+
+from .cache import MemoryCache
+
+# Specifiers whose value depends on the timezone of the formatted value.
+TIMEZONE_SPECIFIERS = frozenset("eITOZr")
+
+_cache = MemoryCache(max_entries=getattr(settings, "JINJA2_DATE_FORMAT_CACHE_SIZE", 256))
+
+
+class CompiledFormat:
+    """
+    A format string parsed for a ``DateFormat`` or ``TimeFormat`` class,
+    formatting values with the same results as ``formatter_class(value).format(format_string)``.
+    """
+
+    def __init__(self, format_string, formatter_class=DateFormat):
+        self.formatter_class = formatter_class
+        self.pieces = []
+        self.time_specifier = None
+        self.needs_timezone = False
+        missing = False
+
+        for i, piece in enumerate(re_formatchars.split(str(format_string))):
+            if i % 2:
+                if self.time_specifier is None and not missing and hasattr(TimeFormat, piece):
+                    self.time_specifier = piece
+                self.needs_timezone |= piece in TIMEZONE_SPECIFIERS
+                method = getattr(formatter_class, piece, None)
+                if method is None:
+                    # Formatting raises the same AttributeError.
+                    method = lambda formatter, piece=piece: getattr(formatter, piece)()
+                    missing = True
+                self.pieces.append((method, None))
+            elif piece:
+                self.pieces.append((None, re_escaped.sub(r"\1", piece)))
+
+    def format(self, value):
+        if self.time_specifier is not None and type(value) is date:
+            raise TypeError(
+                "The format for date objects may not contain "
+                "time-related format specifiers (found '%s')." % self.time_specifier
+            )
+
+        if self.needs_timezone:
+            formatter = self.formatter_class(value)
+        else:
+            formatter = self.formatter_class.__new__(self.formatter_class)
+            formatter.data = value
+            formatter.timezone = None
+
+        return "".join([text if method is None else str(method(formatter))
+                        for method, text in self.pieces])
+
+
+def get_compiled_format(format_type, formatter_class=DateFormat):
+    """
+    Return the ``CompiledFormat`` of the localized ``format_type`` (a
+    format name, like ``"DATE_FORMAT"``, or a format string) for the
+    active language.
+    """
+    format_type = str(format_type)
+    if not _cache.max_entries:
+        return CompiledFormat(get_format(format_type), formatter_class)
+
+    language = get_language()
+    key = (formatter_class, format_type, language)
+    compiled = _cache.get(key)
+    if compiled is None:
+        compiled = CompiledFormat(get_format(format_type, lang=language), formatter_class)
+        _cache.set(key, compiled)
+    return compiled
+
+
+def date_format(value, format=None):
+    """
+    Same as ``django.utils.formats.date_format``.
+    """
+    return get_compiled_format(format or "DATE_FORMAT", DateFormat).format(value)
+
+
+def time_format(value, format=None):
+    """
+    Same as ``django.utils.formats.time_format``.
+    """
+    return get_compiled_format(format or "TIME_FORMAT", TimeFormat).format(value)
+
+
+def clear():
+    _cache.clear()
+
+
+@receiver(setting_changed)
+def _setting_changed(setting, **kwargs):
+    if setting == "JINJA2_DATE_FORMAT_CACHE_SIZE":
+        _cache.max_entries = getattr(settings, setting, 256)
+    clear()
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import jinja2
+from django.conf import settings
+from jinja2.loaders import split_template_path
+
+
+class IndexedFileSystemLoader(jinja2.FileSystemLoader):
+    """
+    A filesystem loader that builds an index of the templates available in
+    its search paths the first time a template is requested, so lookups do
+    not probe every directory (as happens with many ``APP_DIRS``).
+
+    A frozen index is never refreshed. Otherwise, it is refreshed when the
+    django autoreloader reports a change in the search paths. By default
+    the index is frozen unless ``settings.DEBUG`` is enabled.
+    """
+
+    def __init__(self, searchpath, encoding="utf-8", followlinks=False, frozen=None):
+        super().__init__(searchpath, encoding=encoding, followlinks=followlinks)
+
+        if frozen is None:
+            frozen = not settings.DEBUG
+
+        self.frozen = frozen
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build_index()
+                index = self._index
+        return index
+
+    def _build_index(self):
+        index = {}
+        for searchpath in self.searchpath:
+            for dirpath, _, filenames in os.walk(searchpath, followlinks=self.followlinks):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    template = os.path.relpath(path, searchpath).replace(os.path.sep, "/")
+                    # The first search path containing a template wins.
+                    index.setdefault(template, path)
+        return index
+
+    def reset(self):
+        """
+        Drop the index, it will be built again on the next lookup.
+        """
+        self._index = None
+
+    def get_source(self, environment, template):
+        pieces = split_template_path(template)
+        filename = self.index.get("/".join(pieces))
+        if filename is None:
+            raise jinja2.TemplateNotFound(template)
+
+        try:
+            with open(filename, encoding=self.encoding) as f:
+                contents = f.read()
+            mtime = os.path.getmtime(filename)
+        except FileNotFoundError:
+            if not self.frozen:
+                self.reset()
+            raise jinja2.TemplateNotFound(template)
+
+        def uptodate():
+            try:
+                return os.path.getmtime(filename) == mtime
+            except OSError:
+                return False
+
+        return contents, os.path.normpath(filename), uptodate
+
+    def list_templates(self):
+        return sorted(self.index)
@@ -0,0 +1,53 @@
+"""Compile every Jinja2 template ahead of time.
+
+The templates matched by the engine are compiled into python modules,
+which the backend loads instead of parsing and compiling the template
+sources when the ``compiled_templates`` option points to the same path.
+"""
+
+import jinja2
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template import engines
+
+from django_jinja.backend import Jinja2
+
+
+class Command(BaseCommand):
+    help = "Compiles Jinja2 templates into python modules."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "target", nargs="?", default=None,
+            help="Directory (or zip file) where the compiled templates are stored. "
+                 "Defaults to the compiled_templates option of the engine.",
+        )
+        parser.add_argument(
+            "--engine", dest="engine", default=None,
+            help="Name of the Jinja2 template engine to use.",
+        )
+        parser.add_argument(
+            "--zip", dest="zip", default=None, choices=["deflated", "stored"],
+            help="Store the compiled templates in a zip file using this compression.",
+        )
+
+    def handle(self, *args, **options):
+        if options["engine"] is None:
+            engine = Jinja2.get_default()
+        else:
+            engine = engines[options["engine"]]
+            if not isinstance(engine, Jinja2):
+                raise CommandError(f"Template engine {options['engine']} is not a Jinja2 backend.")
+
+        target = options["target"] or engine.compiled_templates
+        if not target:
+            raise CommandError("No target given and the engine has no compiled_templates option.")
+
+        def log_function(message):
+            if options["verbosity"] > 1:
+                self.stdout.write(message)
+
+        try:
+            engine.compile_templates(target, zip=options["zip"], log_function=log_function)
+        except jinja2.TemplateSyntaxError as exc:
+            raise CommandError(f"Error compiling {exc.name}: {exc}")
@@ -0,0 +1,57 @@
+"""Report the context variables each Jinja2 template can read.
+
+The analysis is static: it parses the templates and follows every
+``extends``, ``include`` and ``import`` with a literal template name.
+Templates referencing other templates through an expression are reported
+as incomplete, since those references can not be followed.
+"""
+
+import jinja2
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template import engines
+
+from django_jinja import base
+from django_jinja.backend import Jinja2
+
+
+class Command(BaseCommand):
+    help = "Lists the context variables used by Jinja2 templates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "template_names", nargs="*",
+            help="Templates to analyze. Defaults to every template matched by the engine.",
+        )
+        parser.add_argument(
+            "--engine", dest="engine", default=None,
+            help="Name of the Jinja2 template engine to use.",
+        )
+
+    def handle(self, *args, **options):
+        if options["engine"] is None:
+            engine = Jinja2.get_default()
+        else:
+            engine = engines[options["engine"]]
+            if not isinstance(engine, Jinja2):
+                raise CommandError(f"Template engine {options['engine']} is not a Jinja2 backend.")
+
+        template_names = options["template_names"]
+        if not template_names:
+            try:
+                template_names = [name for name in engine.source_loader.list_templates()
+                                  if engine.match_template(name)]
+            except TypeError:
+                raise CommandError("The template loader can not list templates, "
+                                   "give the template names to analyze.")
+
+        for template_name in template_names:
+            try:
+                variables, unresolved = base.find_template_variables(
+                    engine.env, template_name, loader=engine.source_loader)
+            except jinja2.TemplateNotFound as exc:
+                raise CommandError(f"Template {exc.name} does not exist.")
+            line = f"{template_name}: {', '.join(sorted(variables))}"
+            if unresolved:
+                line += f" (incomplete, dynamic references in: {', '.join(sorted(unresolved))})"
+            self.stdout.write(line)
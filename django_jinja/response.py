@@ -0,0 +1,25 @@
+from django.http import StreamingHttpResponse
+from django.template import loader
+
+
+class StreamingTemplateResponse(StreamingHttpResponse):
+    """
+    A streaming response that renders a jinja template with
+    ``Template.stream``. It accepts the same arguments as django's
+    ``TemplateResponse``, so it can be used as the ``response_class``
+    of class based views, plus an optional ``buffer_size``.
+    """
+
+    def __init__(self, request, template, context=None, content_type=None,
+                 status=None, charset=None, using=None, headers=None, buffer_size=None):
+        super().__init__(content_type=content_type, status=status,
+                         charset=charset, headers=headers)
+
+        if isinstance(template, (list, tuple)):
+            template = loader.select_template(template, using=using)
+        elif isinstance(template, str):
+            template = loader.get_template(template, using=using)
+
+        self.template_name = template
+        self.context_data = context
+        self.streaming_content = template.stream(context, request, buffer_size=buffer_size)
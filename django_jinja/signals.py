@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent by backends with the ``stats`` option enabled, with the engine as
+# sender. Arguments: ``template_name`` and ``duration`` (in seconds).
+template_compiled = Signal()
+
+# Arguments: ``template_name``, ``duration`` (in seconds) and ``hit``.
+bytecode_loaded = Signal()
+
+# Arguments: ``template_name`` and ``duration`` (in seconds).
+bytecode_dumped = Signal()
@@ -0,0 +1,150 @@
+"""
+Memoized static files urls for the ``static()`` global and filter, and
+the contents of the assets inlined with ``inline_static()``.
+
+Urls given by the staticfiles storage are kept in a process level dict,
+that is dropped when the storage manifest is reloaded and on every
+``setting_changed`` signal. With a manifest storage (such as
+``ManifestStaticFilesStorage``), ``preload_static_urls()`` fills it with
+every file of the manifest; it is called by the backend ``warmup()``.
+
+Only the urls of filesystem and manifest storages, that do not change
+between calls, are memoized by default. The urls of other storages (that
+may be signed or expire) are memoized when the
+``JINJA2_STATIC_URL_CACHE_ALL_STORAGES`` setting is enabled.
+
+The number of urls memoized on demand is bounded by the
+``JINJA2_STATIC_URL_CACHE_SIZE`` setting (``0`` disables the memo).
+
+Inlined assets are read and decoded once, and the resulting markup is
+served from memory afterwards. With ``DEBUG`` enabled, they are read
+again when modified.
+"""
+
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from markupsafe import Markup
+
+_urls = None
+_inlined = {}
+_inlined_lock = threading.Lock()
+
+
+def _get_urls():
+    global _urls
+    state = getattr(staticfiles_storage, "hashed_files", None)
+    if _urls is None or _urls[0] is not state:
+        _urls = (state, {} if _memoizes_storage() else None)
+    return _urls[1]
+
+
+def _memoizes_storage():
+    if getattr(settings, "JINJA2_STATIC_URL_CACHE_ALL_STORAGES", False):
+        return True
+    return isinstance(staticfiles_storage, (FileSystemStorage, ManifestFilesMixin))
+
+
+def memoizes_urls():
+    """
+    Whether the urls of the staticfiles storage are memoized.
+    """
+    return _get_urls() is not None
+
+
+def static_url(path):
+    """
+    Same as ``staticfiles_storage.url(path)``, memoizing the results.
+    """
+    size = getattr(settings, "JINJA2_STATIC_URL_CACHE_SIZE", 10000)
+    urls = _get_urls() if size else None
+    if urls is None:
+        return staticfiles_storage.url(path)
+
+    try:
+        return urls[path]
+    except KeyError:
+        url = staticfiles_storage.url(path)
+        if len(urls) < size:
+            urls[path] = url
+        return url
+
+
+def preload_static_urls():
+    """
+    Memoize the url of every file of the staticfiles storage manifest,
+    up to ``JINJA2_STATIC_URL_CACHE_SIZE`` urls. Returns the number of
+    memoized urls (``0`` when the storage has no manifest).
+    """
+    size = getattr(settings, "JINJA2_STATIC_URL_CACHE_SIZE", 10000)
+    if not size:
+        return 0
+
+    hashed_files = getattr(staticfiles_storage, "hashed_files", None)
+    urls = _get_urls()
+    if not hashed_files or urls is None:
+        return 0
+
+    for name in list(hashed_files):
+        if len(urls) >= size:
+            break
+        if name not in urls:
+            urls[name] = staticfiles_storage.url(name)
+    return len(urls)
+
+
+def _find(path):
+    if not settings.DEBUG:
+        try:
+            filename = staticfiles_storage.path(path)
+        except NotImplementedError:
+            filename = None
+        if filename and os.path.isfile(filename):
+            return filename
+
+    filename = finders.find(path)
+    if filename is None:
+        raise FileNotFoundError(f"The static file '{path}' could not be found")
+    return filename
+
+
+def _read(filename):
+    with open(filename, "rb") as f:
+        return Markup(f.read().decode("utf-8"))
+
+
+def inline_static(path):
+    """
+    Return the contents of the static file ``path`` (decoded as utf-8)
+    as safe markup, to be inlined in the templates.
+    """
+    entry = _inlined.get(path)
+    if entry is None or settings.DEBUG:
+        filename = _find(path)
+        mtime = os.stat(filename).st_mtime_ns
+        if entry is None or entry[0] != (filename, mtime):
+            with _inlined_lock:
+                entry = _inlined.get(path)
+                if entry is None or entry[0] != (filename, mtime):
+                    entry = ((filename, mtime), _read(filename))
+                    _inlined[path] = entry
+
+    return entry[1]
+
+
+def clear():
+    global _urls
+    _urls = None
+    _inlined.clear()
+
+
+@receiver(setting_changed)
+def _setting_changed(**kwargs):
+    clear()
@@ -0,0 +1,149 @@
+import functools
+import threading
+import time
+
+from jinja2.utils import LRUCache
+
+from . import signals
+
+
+class TemplateStats:
+    """
+    Thread safe counters and timings of the template loading of a backend.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys((
+            "cache_hits", "cache_misses", "cache_evictions",
+            "compiles", "bytecode_hits", "bytecode_misses", "bytecode_dumps",
+        ), 0)
+        self.timings = dict.fromkeys(("compile_time", "bytecode_load_time", "bytecode_dump_time"), 0.0)
+        self.compile_times = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_time(self, name, duration):
+        with self._lock:
+            self.timings[name] += duration
+
+    def record_compile(self, template_name, duration):
+        with self._lock:
+            self.counters["compiles"] += 1
+            self.timings["compile_time"] += duration
+            self.compile_times[template_name] = duration
+
+    def snapshot(self):
+        with self._lock:
+            result = dict(self.counters, **self.timings)
+            result["compile_times"] = dict(self.compile_times)
+
+        loads = result["bytecode_hits"] + result["bytecode_misses"]
+        result["bytecode_hit_ratio"] = result["bytecode_hits"] / loads if loads else None
+        return result
+
+
+class InstrumentedLRUCache(LRUCache):
+    """
+    The jinja environment cache, counting hits, misses and evictions.
+    """
+
+    def __init__(self, capacity, stats=None):
+        super().__init__(capacity)
+        self.stats = stats if stats is not None else TemplateStats()
+
+    def get(self, key, default=None):
+        try:
+            rv = self[key]
+        except KeyError:
+            self.stats.incr("cache_misses")
+            return default
+        self.stats.incr("cache_hits")
+        return rv
+
+    def __setitem__(self, key, value):
+        if key not in self and len(self) >= self.capacity:
+            self.stats.incr("cache_evictions")
+        super().__setitem__(key, value)
+
+
+class InstrumentedDict(dict):
+    """
+    The unbounded jinja environment cache, counting hits and misses.
+    """
+
+    def __init__(self, stats=None):
+        super().__init__()
+        self.stats = stats if stats is not None else TemplateStats()
+
+    def get(self, key, default=None):
+        try:
+            rv = self[key]
+        except KeyError:
+            self.stats.incr("cache_misses")
+            return default
+        self.stats.incr("cache_hits")
+        return rv
+
+
+def instrument(engine, stats):
+    """
+    Wrap the environment cache, the compilation and the bytecode cache of
+    the engine to collect counters and timings in ``stats`` and send the
+    ``django_jinja.signals`` signals.
+    """
+    env = engine.env
+
+    if isinstance(env.cache, LRUCache):
+        env.cache = InstrumentedLRUCache(env.cache.capacity, stats)
+    elif env.cache is not None:
+        env.cache = InstrumentedDict(stats)
+
+    compile = env.compile
+
+    @functools.wraps(compile)
+    def _compile(source, name=None, filename=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return compile(source, name, filename, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            stats.record_compile(name, duration)
+            signals.template_compiled.send(sender=engine, template_name=name, duration=duration)
+
+    env.compile = _compile
+
+    bytecode_cache = env.bytecode_cache
+    if bytecode_cache is None:
+        return
+
+    get_bucket = bytecode_cache.get_bucket
+    set_bucket = bytecode_cache.set_bucket
+
+    @functools.wraps(get_bucket)
+    def _get_bucket(environment, name, filename, source):
+        start = time.perf_counter()
+        bucket = get_bucket(environment, name, filename, source)
+        duration = time.perf_counter() - start
+
+        hit = bucket.code is not None
+        stats.incr("bytecode_hits" if hit else "bytecode_misses")
+        stats.add_time("bytecode_load_time", duration)
+        signals.bytecode_loaded.send(sender=engine, template_name=name, duration=duration, hit=hit)
+        return bucket
+
+    @functools.wraps(set_bucket)
+    def _set_bucket(bucket):
+        start = time.perf_counter()
+        set_bucket(bucket)
+        duration = time.perf_counter() - start
+
+        name = getattr(bucket, "name", None)
+        stats.incr("bytecode_dumps")
+        stats.add_time("bytecode_dump_time", duration)
+        signals.bytecode_dumped.send(sender=engine, template_name=name, duration=duration)
+
+    bytecode_cache.get_bucket = _get_bucket
+    bytecode_cache.set_bucket = _set_bucket
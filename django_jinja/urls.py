@@ -0,0 +1,250 @@
+"""
+Memoized url reversing for the ``url()`` global and ``reverseurl`` filter.
+
+Results of ``django.urls.reverse`` (including ``NoReverseMatch`` errors)
+are kept in a bounded LRU attached to the url resolver, so they are
+dropped along with it by ``clear_url_caches()``, and on every
+``setting_changed`` signal. Keys include the view name, arguments,
+current app and urlconf, and the script prefix and active language, as
+the reversed url also depends on them.
+
+The size of the cache is set by the ``JINJA2_URL_REVERSE_CACHE_SIZE``
+setting (``0`` disables it).
+
+``UrlBuilder`` builds many urls of the same view, resolving its patterns
+once.
+"""
+
+import re
+import uuid
+import weakref
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import NoReverseMatch
+from django.urls import get_ns_resolver
+from django.urls import get_resolver
+from django.urls import get_script_prefix
+from django.urls import get_urlconf
+from django.urls import reverse as django_reverse
+from django.utils.http import RFC3986_SUBDELIMS
+from django.utils.http import escape_leading_slashes
+from django.utils.translation import get_language
+
+from .cache import MemoryCache
+
+# Exact types of the arguments whose string value is fully determined by
+# their hash and equality (so that, for example, ``1`` and ``True`` are
+# never mixed up).
+CACHEABLE_TYPES = frozenset((str, int, uuid.UUID))
+
+_caches = weakref.WeakSet()
+
+
+def _get_cache(resolver):
+    cache = getattr(resolver, "_django_jinja_reverse_cache", None)
+    if cache is None:
+        size = getattr(settings, "JINJA2_URL_REVERSE_CACHE_SIZE", 1000)
+        cache = MemoryCache(max_entries=size)
+        resolver._django_jinja_reverse_cache = cache
+        _caches.add(cache)
+    return cache
+
+
+def _is_cacheable(viewname, args, kwargs):
+    if type(viewname) is not str and not callable(viewname):
+        return False
+    return (all(type(value) in CACHEABLE_TYPES for value in args) and
+            all(type(value) in CACHEABLE_TYPES for value in kwargs.values()))
+
+
+def reverse(viewname, urlconf=None, args=None, kwargs=None, current_app=None):
+    """
+    Same as ``django.urls.reverse``, memoizing the results.
+    """
+    args = args or ()
+    kwargs = kwargs or {}
+
+    if (not getattr(settings, "JINJA2_URL_REVERSE_CACHE_SIZE", 1000) or
+            not _is_cacheable(viewname, args, kwargs)):
+        return django_reverse(viewname, urlconf, args, kwargs, current_app)
+
+    if urlconf is None:
+        urlconf = get_urlconf()
+
+    cache = _get_cache(get_resolver(urlconf))
+    key = (viewname, tuple(args), tuple(sorted(kwargs.items())), current_app,
+           urlconf, get_script_prefix(), get_language())
+
+    result = cache.get(key)
+    if result is None:
+        try:
+            result = django_reverse(viewname, urlconf, args, kwargs, current_app)
+        except NoReverseMatch as exc:
+            result = exc
+        cache.set(key, result)
+
+    if isinstance(result, NoReverseMatch):
+        raise NoReverseMatch(*result.args)
+    return result
+
+
+def _resolve_namespace(viewname, resolver, current_app=None):
+    """
+    Return the resolver and view name of ``viewname`` (that may be
+    namespaced), as resolved by ``django.urls.reverse``.
+    """
+    if not isinstance(viewname, str):
+        return resolver, viewname
+
+    *path, view = viewname.split(":")
+
+    if current_app:
+        current_path = current_app.split(":")
+        current_path.reverse()
+    else:
+        current_path = None
+
+    resolved_path = []
+    ns_pattern = ""
+    ns_converters = {}
+    for ns in path:
+        current_ns = current_path.pop() if current_path else None
+        # Lookup the name to see if it could be an app identifier.
+        try:
+            app_list = resolver.app_dict[ns]
+            if current_ns and current_ns in app_list:
+                ns = current_ns
+            elif ns not in app_list:
+                ns = app_list[0]
+        except KeyError:
+            pass
+
+        if ns != current_ns:
+            current_path = None
+
+        try:
+            extra, resolver = resolver.namespace_dict[ns]
+        except KeyError as key:
+            if resolved_path:
+                raise NoReverseMatch(
+                    f"{key} is not a registered namespace inside '{':'.join(resolved_path)}'")
+            raise NoReverseMatch(f"{key} is not a registered namespace")
+
+        resolved_path.append(ns)
+        ns_pattern += extra
+        ns_converters.update(resolver.pattern.converters)
+
+    if ns_pattern:
+        resolver = get_ns_resolver(ns_pattern, resolver, tuple(ns_converters.items()))
+    return resolver, view
+
+
+class UrlBuilder:
+    """
+    Builds urls of the ``viewname`` view, giving the same results as
+    ``django.urls.reverse``, but resolving its namespace and patterns
+    once (for the current urlconf and script prefix):
+
+        builder = UrlBuilder("shop:product-detail")
+        urls = [builder(pk=product.pk) for product in products]
+        urls = builder.many([{"pk": product.pk} for product in products])
+
+    When ``silent`` is set, urls that cannot be reversed are returned as
+    an empty string instead of raising ``NoReverseMatch``.
+    """
+
+    def __init__(self, viewname, urlconf=None, current_app=None, silent=False):
+        if urlconf is None:
+            urlconf = get_urlconf()
+
+        self.viewname = viewname
+        self.urlconf = urlconf
+        self.current_app = current_app
+        self.silent = silent
+        self.candidates = self._prepare(get_script_prefix())
+
+    def _prepare(self, prefix):
+        try:
+            resolver, view = _resolve_namespace(self.viewname, get_resolver(self.urlconf),
+                                                self.current_app)
+        except NoReverseMatch:
+            # Reversing will raise the same error.
+            return []
+
+        if not resolver._populated:
+            resolver._populate()
+
+        candidates = []
+        for possibility, pattern, defaults, converters in resolver.reverse_dict.getlist(view):
+            regex = re.compile(f"^{re.escape(prefix)}{pattern}")
+            for result, params in possibility:
+                candidate_pat = prefix.replace("%", "%%") + result
+                candidates.append((candidate_pat, params, set(params), regex, defaults, converters))
+        return candidates
+
+    def _build(self, args, kwargs):
+        if args and kwargs:
+            raise ValueError("Don't mix *args and **kwargs in call to reverse()!")
+
+        for candidate_pat, params, param_set, regex, defaults, converters in self.candidates:
+            if args:
+                if len(args) != len(params):
+                    continue
+                candidate_subs = dict(zip(params, args))
+            else:
+                if set(kwargs).symmetric_difference(param_set).difference(defaults):
+                    continue
+                if any(kwargs.get(k, v) != v for k, v in defaults.items() if k not in param_set):
+                    continue
+                candidate_subs = kwargs
+
+            text_candidate_subs = {}
+            try:
+                for k, v in candidate_subs.items():
+                    if k in converters:
+                        text_candidate_subs[k] = converters[k].to_url(v)
+                    else:
+                        text_candidate_subs[k] = str(v)
+            except ValueError:
+                continue
+
+            url = candidate_pat % text_candidate_subs
+            if regex.search(url):
+                return escape_leading_slashes(quote(url, safe=RFC3986_SUBDELIMS + "/~:@"))
+
+        # Not found: reverse gives the error message.
+        return django_reverse(self.viewname, self.urlconf, args, kwargs, self.current_app)
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return self._build(args, kwargs)
+        except NoReverseMatch:
+            if not self.silent:
+                raise
+            return ""
+
+    def many(self, arguments):
+        """
+        Return the urls built with each item of ``arguments``, a sequence
+        of keyword arguments dicts (or of positional arguments tuples).
+        """
+        if isinstance(arguments, dict):
+            raise TypeError("many() takes a sequence of arguments")
+
+        return [self(**item) if isinstance(item, dict) else self(*item) for item in arguments]
+
+
+def clear_reverse_cache():
+    for cache in list(_caches):
+        cache.clear()
+
+
+@receiver(setting_changed)
+def _setting_changed(setting, **kwargs):
+    if setting == "JINJA2_URL_REVERSE_CACHE_SIZE":
+        for cache in list(_caches):
+            cache.max_entries = getattr(settings, setting, 1000)
+    clear_reverse_cache()
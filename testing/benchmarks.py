@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Micro benchmarks of django-jinja helpers against their django
+counterparts.
+
+Usage: python benchmarks.py [name ...]
+"""
+import os, sys, timeit
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+
+def bench_urls(number=1000):
+    from django.urls import reverse
+    from django_jinja.urls import UrlBuilder
+    from django_jinja.urls import reverse as cached_reverse
+
+    pks = range(number)
+    builder = UrlBuilder("shop:product-detail")
+
+    return {
+        "reverse": lambda: [reverse("shop:product-detail", kwargs={"pk": pk}) for pk in pks],
+        "cached reverse": lambda: [cached_reverse("shop:product-detail", kwargs={"pk": pk})
+                                   for pk in pks],
+        "url_builder": lambda: [builder(pk=pk) for pk in pks],
+        "url_builder.many": lambda: builder.many([{"pk": pk} for pk in pks]),
+    }
+
+
+def bench_dates(number=2000):
+    import datetime
+    from django.template import defaultfilters
+    from django_jinja.builtins import filters
+
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    values = [start + datetime.timedelta(minutes=i) for i in range(number)]
+
+    return {
+        "django date": lambda: [defaultfilters.date(value, "DATETIME_FORMAT") for value in values],
+        "date": lambda: [filters.date(value, "DATETIME_FORMAT") for value in values],
+        "django date (tz)": lambda: [defaultfilters.date(value, "c e O") for value in values],
+        "date (tz)": lambda: [filters.date(value, "c e O") for value in values],
+        "django time": lambda: [defaultfilters.time(value, "H:i") for value in values],
+        "time": lambda: [filters.time(value, "H:i") for value in values],
+    }
+
+
+BENCHMARKS = {
+    "urls": bench_urls,
+    "dates": bench_dates,
+}
+
+
+def run(names, repeat=5):
+    for name in names:
+        print(f"{name}:")
+        for label, function in BENCHMARKS[name]().items():
+            best = min(timeit.repeat(function, number=1, repeat=repeat))
+            print(f"  {label:<20} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    import django
+    django.setup()
+    run(sys.argv[1:] or list(BENCHMARKS))
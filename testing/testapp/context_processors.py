@@ -0,0 +1,32 @@
+calls = {
+    "counter": 0,
+    "uncached_counter": 0,
+    "lazy_counter": 0,
+    "async_counter": 0,
+    "async_lazy": 0,
+}
+
+
+def counter(request):
+    calls["counter"] += 1
+    return {"counter": calls["counter"]}
+
+
+def uncached_counter(request):
+    calls["uncached_counter"] += 1
+    return {"uncached_counter": calls["uncached_counter"]}
+
+
+def lazy_counter(request):
+    calls["lazy_counter"] += 1
+    return {"lazy_counter": calls["lazy_counter"], "lazy_other": "other"}
+
+
+async def async_lazy(request):
+    calls["async_lazy"] += 1
+    return {"async_lazy": calls["async_lazy"]}
+
+
+async def async_counter(request):
+    calls["async_counter"] += 1
+    return {"async_counter": calls["async_counter"]}
@@ -1,25 +1,49 @@
+import asyncio
 import datetime
+import io
+import os
+import tempfile
+import time
+import unittest
 
+from pathlib import Path
 from unittest import mock
 
+import jinja2
+
+from django.apps import apps
 from django.conf import global_settings
 from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
 from django.urls import reverse
 from django.middleware import csrf
 from django.shortcuts import render
 from django.template import RequestContext
+from django.template import TemplateDoesNotExist
 from django.template import engines
 from django.template.loader import get_template
 from django.test import TestCase
 from django.test import override_settings
 from django.test.client import RequestFactory
 from django.utils import timezone
+from django.utils.autoreload import file_changed
 from django_jinja.backend import Jinja2
+from django_jinja import signals
+from django_jinja import staticfiles
 from django_jinja.base import get_match_extension
+from django_jinja.cache import BytecodeCache
+from django_jinja.cache import MemoryCache
+from django_jinja.cache import MmapBytecodeCache
+from django_jinja.cache import TwoTierBytecodeCache
 from django_jinja.base import match_template
+from django_jinja.builtins import extensions
+from django_jinja.loaders import IndexedFileSystemLoader
 from django_jinja.views.generic.base import Jinja2TemplateResponseMixin
 
+from . import context_processors
 from .forms import TestForm
 from .models import TestModel
 from .views import StreamingTestView
@@ -74,6 +98,311 @@ class RenderTemplatesTests(TestCase):
         template = self.env.from_string("{{ url('adads') }}")
         template.render({})
 
+    def test_url_reverse_cache(self):
+        from django.urls import NoReverseMatch
+        from django.urls import clear_url_caches
+        from django.utils.safestring import SafeString
+        from django_jinja import urls
+
+        template = self.env.from_string(
+            "{% for i in range(3) %}{{ url('test-1', data=2) }} {{ name|reverseurl }} "
+            "{{ url('adads') }} {% endfor %}"
+        )
+        urls.clear_reverse_cache()
+
+        with mock.patch("django_jinja.urls.django_reverse", wraps=urls.django_reverse) as reverse_mock:
+            self.assertEqual(template.render({"name": "test-1"}), "/test1/2/ /test1/  " * 3)
+            self.assertEqual(reverse_mock.call_count, 3)
+
+            # Negative results are cached too.
+            with self.assertRaises(NoReverseMatch):
+                urls.reverse("adads")
+            self.assertEqual(reverse_mock.call_count, 3)
+
+            # Arguments of other types are not cached.
+            self.assertEqual(urls.reverse("test-1", kwargs={"data": SafeString("2")}), "/test1/2/")
+            self.assertEqual(urls.reverse("test-1", kwargs={"data": SafeString("2")}), "/test1/2/")
+            self.assertEqual(reverse_mock.call_count, 5)
+
+            clear_url_caches()
+            self.assertEqual(urls.reverse("test-1"), "/test1/")
+            self.assertEqual(reverse_mock.call_count, 6)
+
+            with override_settings(JINJA2_URL_REVERSE_CACHE_SIZE=0):
+                self.assertEqual(urls.reverse("test-1"), "/test1/")
+                self.assertEqual(reverse_mock.call_count, 7)
+
+            # Settings changes clear the cache.
+            self.assertEqual(urls.reverse("test-1"), "/test1/")
+            self.assertEqual(reverse_mock.call_count, 8)
+
+            # The cache is resized with the setting.
+            with override_settings(JINJA2_URL_REVERSE_CACHE_SIZE=1):
+                for data in (1, 2, 1):
+                    urls.reverse("test-1", kwargs={"data": data})
+                self.assertEqual(reverse_mock.call_count, 11)
+            urls.reverse("test-1", kwargs={"data": 1})
+            urls.reverse("test-1", kwargs={"data": 2})
+            urls.reverse("test-1", kwargs={"data": 1})
+            self.assertEqual(reverse_mock.call_count, 13)
+
+    def test_url_builder(self):
+        from django.urls import NoReverseMatch
+        from django.urls import set_script_prefix
+        from django_jinja.urls import UrlBuilder
+
+        cases = [
+            ("test-1", None, (), {}),
+            ("test-1", None, (), {"data": 2}),
+            ("test-1", None, (5,), {}),
+            ("shop:product-detail", None, (), {"pk": 3}),
+            ("shop:product-detail", "shop-eu", (), {"pk": 3}),
+            ("shop-eu:product-detail", None, (3,), {}),
+            ("shop:product-page", "shop-eu", (), {"slug": "a-b", "rest": "x y/é?&//z"}),
+        ]
+        for prefix in ("/", "/sub%dir/"):
+            set_script_prefix(prefix)
+            try:
+                for name, current_app, args, kwargs in cases:
+                    builder = UrlBuilder(name, current_app=current_app)
+                    self.assertEqual(
+                        builder(*args, **kwargs),
+                        reverse(name, args=args, kwargs=kwargs, current_app=current_app),
+                    )
+            finally:
+                set_script_prefix("/")
+
+        builder = UrlBuilder("shop:product-detail")
+        self.assertEqual(builder.many([{"pk": 1}, {"pk": 2}, (3,)]),
+                         ["/shop/products/1/", "/shop/products/2/", "/shop/products/3/"])
+        with self.assertRaisesMessage(NoReverseMatch, "Reverse for 'product-detail' with keyword"):
+            builder(pk="x")
+        with self.assertRaisesMessage(NoReverseMatch, "'nope' is not a registered namespace"):
+            UrlBuilder("nope:product-detail")(pk=1)
+        self.assertEqual(UrlBuilder("nope:product-detail", silent=True)(pk=1), "")
+
+        request = self.factory.get("/")
+        request.current_app = "shop-eu"
+        template = self.env.from_string(
+            "{% set product_url = url_builder('shop:product-detail') %}"
+            "{% for pk in pks %}{{ product_url(pk=pk) }} {% endfor %}"
+            "{{ url_builder('adads')() }}"
+        )
+        self.assertEqual(template.render({"pks": [1, 2]}, request),
+                         "/shop-eu/products/1/ /shop-eu/products/2/ ")
+
+    def test_constant_folding(self):
+        from django.urls import clear_url_caches
+        from django_jinja.builtins import DEFAULT_EXTENSIONS
+
+        env = Jinja2({
+            "NAME": "jinja2folding",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "extensions": DEFAULT_EXTENSIONS + [
+                    "django_jinja.builtins.extensions.ConstantFoldingExtension",
+                ],
+            },
+        })
+        template = env.from_string(
+            "{% for i in range(2) %}{{ url('test-1') }} {{ url('test-1', data=2) }} "
+            "{{ url('test-1', data=i) }} {{ static('css/site.css') }} {{ url('adads') }}|"
+            "{% endfor %}"
+        )
+        ast = env.env.parse(
+            "{{ url('test-1') }}{{ url('test-1', data=i) }}{{ obj.url('a') }}{{ 'a'|static }}"
+            "{{ url('ns:name') }}{{ static('a') }}{% if x is static %}{% endif %}"
+        )
+        names = [node.name for node in ast.find_all(jinja2.nodes.Name)]
+        self.assertEqual(names.count("_folded_url"), 1)
+        self.assertEqual(names.count("_folded_static"), 1)
+        self.assertEqual(names.count("url"), 2)
+
+        # Templates binding the names are not folded.
+        for source in ("{% macro url(name) %}{% endmacro %}",
+                       "{% set url = cycler %}",
+                       "{% from 'macros.jinja' import url %}",
+                       "{% import 'macros.jinja' as static %}",
+                       "{% for url in urls %}{% endfor %}",
+                       "{% macro link(url) %}{% endmacro %}",
+                       "{% with static = 1 %}{% endwith %}",
+                       "{% call(url) link() %}{% endcall %}"):
+            ast = env.env.parse(source + "{{ url('test-1') }}{{ static('a') }}")
+            names = [node.name for node in ast.find_all(jinja2.nodes.Name)]
+            self.assertNotIn("_folded_url", names)
+            self.assertNotIn("_folded_static", names)
+
+        with mock.patch("django_jinja.builtins.extensions.reverse",
+                        wraps=extensions.reverse) as reverse_mock, \
+                mock.patch("django_jinja.builtins.extensions.staticfiles_storage") as storage:
+            storage.url.side_effect = lambda path: f"/static/{path}"
+            storage.hashed_files = {}
+            expected = "/test1/ /test1/2/ /test1/{i}/ /static/css/site.css |"
+            self.assertEqual(template.render({}), expected.format(i=0) + expected.format(i=1))
+            self.assertEqual(template.render({}), expected.format(i=0) + expected.format(i=1))
+            # url(..., data=i) is not folded.
+            self.assertEqual(reverse_mock.call_count, 3 + 4)
+            self.assertEqual(storage.url.call_count, 1)
+
+            # A new url resolver or manifest resolve the values again.
+            clear_url_caches()
+            storage.hashed_files = {"css/site.css": "css/site.123.css"}
+            template.render({})
+            self.assertEqual(reverse_mock.call_count, 7 + 3 + 2)
+            self.assertEqual(storage.url.call_count, 2)
+
+            with override_settings(STATIC_URL="/assets/"):
+                template.render({})
+            self.assertEqual(storage.url.call_count, 3)
+
+            # Values are kept per language.
+            from django.utils import translation
+            template = env.from_string("{{ url('test-1') }}")
+            reverse_mock.reset_mock()
+            for language in ("en", "es", "en", "es"):
+                with translation.override(language):
+                    self.assertEqual(template.render({}), "/test1/")
+            self.assertEqual(reverse_mock.call_count, 2)
+
+    def test_static_urls_memo(self):
+        staticfiles.clear()
+        template = self.env.from_string("{{ static(name) }} {{ name|static }}")
+
+        from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+        with mock.patch("django_jinja.staticfiles.staticfiles_storage",
+                        spec=ManifestStaticFilesStorage) as storage:
+            storage.url.side_effect = lambda path: f"/static/{path}"
+            storage.hashed_files = {"style.css": "style.123.css", "script.js": "script.456.js"}
+
+            self.assertEqual(staticfiles.preload_static_urls(), 2)
+            self.assertEqual(storage.url.call_count, 2)
+            self.assertEqual(template.render({"name": "style.css"}),
+                             "/static/style.css /static/style.css")
+            self.assertEqual(storage.url.call_count, 2)
+
+            # A reloaded manifest drops the memoized urls.
+            storage.hashed_files = {"style.css": "style.789.css"}
+            self.assertEqual(template.render({"name": "style.css"}),
+                             "/static/style.css /static/style.css")
+            self.assertEqual(storage.url.call_count, 3)
+
+            with override_settings(JINJA2_STATIC_URL_CACHE_SIZE=0):
+                template.render({"name": "style.css"})
+                self.assertEqual(staticfiles.preload_static_urls(), 0)
+            self.assertEqual(storage.url.call_count, 5)
+
+            # Preloading stops at the size of the memo.
+            storage.hashed_files = {"a.css": "a.1.css", "b.css": "b.1.css", "c.css": "c.1.css"}
+            with override_settings(JINJA2_STATIC_URL_CACHE_SIZE=2):
+                self.assertEqual(staticfiles.preload_static_urls(), 2)
+                self.assertEqual(storage.url.call_count, 7)
+
+        # The urls of other storages (e.g. signed urls) are not memoized by default.
+        with mock.patch("django_jinja.staticfiles.staticfiles_storage") as storage:
+            storage.url.side_effect = lambda path: f"/static/{path}"
+            storage.hashed_files = {"style.css": "style.123.css"}
+            staticfiles.clear()
+            self.assertEqual(staticfiles.preload_static_urls(), 0)
+            template.render({"name": "style.css"})
+            self.assertEqual(storage.url.call_count, 2)
+
+            with override_settings(JINJA2_STATIC_URL_CACHE_ALL_STORAGES=True):
+                template.render({"name": "style.css"})
+                self.assertEqual(storage.url.call_count, 3)
+
+    def test_inline_static(self):
+        staticfiles.clear()
+        template = self.env.from_string("<style>{{ inline_static('style.css') }}</style>")
+        self.assertEqual(template.render({}), "<style>body { font-size: 12px; }\n</style>")
+
+        with mock.patch("django_jinja.staticfiles.open", wraps=open) as open_mock:
+            template.render({})
+            self.assertEqual(open_mock.call_count, 0)
+
+        # The decoded contents are reused.
+        self.assertIs(staticfiles.inline_static("style.css"), staticfiles.inline_static("style.css"))
+
+        with tempfile.TemporaryDirectory() as tmpdir, override_settings(DEBUG=True):
+            filename = os.path.join(tmpdir, "app.js")
+            with open(filename, "w") as f:
+                f.write("a();")
+
+            with mock.patch("django_jinja.staticfiles.finders.find", return_value=filename):
+                self.assertEqual(staticfiles.inline_static("app.js"), "a();")
+                with open(filename, "w") as f:
+                    f.write("b();")
+                os.utime(filename, ns=(0, 0))
+                self.assertEqual(staticfiles.inline_static("app.js"), "b();")
+
+        with self.assertRaises(FileNotFoundError):
+            staticfiles.inline_static("missing.css")
+
+    def test_date_filters(self):
+        from django.template import defaultfilters
+        from django.utils import translation
+        from django_jinja import dateformat
+        from django_jinja.builtins import filters
+
+        values = [
+            datetime.datetime(2012, 12, 20, 13, 5, 9, 123),
+            datetime.datetime(2012, 12, 20, 13, 5, 9, tzinfo=datetime.timezone.utc),
+            datetime.date(2012, 3, 1),
+            datetime.time(0, 0, 1),
+            "2012-12-20", None, "", 42,
+        ]
+        try:
+            import zoneinfo
+        except ImportError:
+            pass
+        else:
+            # Ambiguous in the New York timezone.
+            new_york = zoneinfo.ZoneInfo("America/New_York")
+            values.append(datetime.datetime(2023, 11, 5, 1, 30, tzinfo=new_york))
+        formats = [None, "DATE_FORMAT", "SHORT_DATETIME_FORMAT", "TIME_FORMAT",
+                   r"jS \o\f F Y, P e O T Z I r U", "d/m/y", "H:i:s.u A", "c", "d H"]
+
+        dateformat.clear()
+        for language in ("en", "es"):
+            with translation.override(language):
+                for value in values:
+                    for format in formats:
+                        for filter, django_filter in ((filters.date, defaultfilters.date),
+                                                      (filters.time, defaultfilters.time)):
+                            try:
+                                expected = django_filter(value, format)
+                            except Exception as exc:
+                                with self.assertRaisesMessage(type(exc), str(exc)):
+                                    filter(value, format)
+                            else:
+                                self.assertEqual(filter(value, format), expected,
+                                                 (language, value, format, filter))
+
+        template = self.env.from_string("{{ now|date('SHORT_DATE_FORMAT') }}")
+        with mock.patch("django_jinja.dateformat.CompiledFormat",
+                        wraps=dateformat.CompiledFormat) as compiled:
+            for day in range(1, 4):
+                template.render({"now": datetime.date(2012, 12, day)})
+            self.assertEqual(compiled.call_count, 1)
+
+            # naturalday formats the other days with the compiled formats.
+            from django.contrib.humanize.templatetags import humanize
+            from django_jinja.contrib._humanize.templatetags import _humanize
+
+            today = timezone.now()
+            for value in (today, today - datetime.timedelta(days=1),
+                          today + datetime.timedelta(days=1), datetime.date(2012, 12, 1), "x"):
+                self.assertEqual(_humanize.naturalday(value, "SHORT_DATE_FORMAT"),
+                                 humanize.naturalday(value, "SHORT_DATE_FORMAT"))
+            self.assertEqual(compiled.call_count, 1)
+
+            # Formats are compiled again when a setting changes.
+            with override_settings(FORMAT_MODULE_PATH=None):
+                self.assertEqual(template.render({"now": datetime.date(2012, 12, 1)}),
+                                 "12/01/2012")
+            self.assertEqual(compiled.call_count, 2)
+
     def test_custom_addons_01(self):
         template = self.env.from_string("{{ 'Hello'|replace('H','M') }}")
         result = template.render({})
@@ -230,6 +559,286 @@ class RenderTemplatesTests(TestCase):
         self.assertEqual(result1, "foo foo berry")
         self.assertEqual(result2, "foo foo berry")
 
+    def test_cache_grace_time(self):
+        env = Jinja2({
+            "NAME": "jinja2fragments",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "fragment_cache": {"grace_time": 60, "lock_wait": 0, "early_recompute": 0},
+            },
+        })
+        key = make_template_fragment_key("grace")
+        template = env.from_string("{% cache 200 'grace' %}{{ value }}{% endcache %}")
+
+        cache.clear()
+        self.assertEqual(template.render({"value": "first"}), "first")
+        self.assertEqual(template.render({"value": "second"}), "first")
+        value, fresh_until, delta, generations = cache.get(key)
+        self.assertEqual(value, "first")
+        self.assertEqual(generations, ())
+        self.assertGreater(fresh_until, time.time() + 190)
+
+        # Expired: served stale while another request holds the lock.
+        cache.set(key, ("first", time.time() - 1, 0))
+        cache.add(f"{key}.lock", 1)
+        self.assertEqual(template.render({"value": "second"}), "first")
+
+        # Expired and unlocked: recomputed.
+        cache.delete(f"{key}.lock")
+        self.assertEqual(template.render({"value": "second"}), "second")
+        self.assertIsNone(cache.get(f"{key}.lock"))
+
+        # Missing while locked: recomputed after waiting for the lock.
+        cache.delete(key)
+        cache.add(f"{key}.lock", 1)
+        self.assertEqual(template.render({"value": "third"}), "third")
+
+        async_env = Jinja2({
+            "NAME": "jinja2fragmentsasync",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "enable_async": True,
+                "fragment_cache": {"grace_time": 60, "lock_wait": 0, "early_recompute": 0},
+            },
+        })
+        template = async_env.from_string("{% cache 200 'grace' %}{{ value }}{% endcache %}")
+        cache.set(key, ("third", time.time() - 1, 0))
+        self.assertEqual(asyncio.run(template.render_async({"value": "fourth"})), "third")
+        cache.delete(f"{key}.lock")
+        self.assertEqual(asyncio.run(template.render_async({"value": "fourth"})), "fourth")
+
+    def test_cache_prefetch(self):
+        template_content = (
+            "{% cache_prefetch 'prefetch', items %}{% for item in items %}"
+            "{% cache 200 'prefetch' item %}{{ item }}{{ suffix }}{% endcache %}"
+            "{% endfor %}{% endcache_prefetch %}"
+        )
+        template = self.env.from_string(template_content)
+
+        cache.clear()
+        cache.set(make_template_fragment_key("prefetch", [2]), "2cached")
+
+        with mock.patch.object(cache, "get", wraps=cache.get) as cache_get, \
+                mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            result = template.render({"items": [1, 2, 3, 1], "suffix": "a"})
+
+        self.assertEqual(result, "1a2cached3a1a")
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(len(get_many.call_args[0][0]), 3)
+        self.assertEqual(set_many.call_count, 1)
+        self.assertEqual(len(set_many.call_args[0][0]), 2)
+        # locmem's get_many calls get once per key.
+        self.assertEqual(cache_get.call_count, 3)
+
+        result = template.render({"items": [1, 2, 3], "suffix": "b"})
+        self.assertEqual(result, "1a2cached3a")
+
+        async_env = Jinja2({
+            "NAME": "jinja2prefetchasync",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {"enable_async": True},
+        })
+        template = async_env.from_string(template_content)
+        result = asyncio.run(template.render_async({"items": [1, 4], "suffix": "c"}))
+        self.assertEqual(result, "1a4c")
+        self.assertEqual(cache.get(make_template_fragment_key("prefetch", [4])), "4c")
+
+    def test_cache_prefetch_single_render(self):
+        template = self.env.from_string(
+            "{% cache_prefetch 'product', pks, 'price', pks|map('string') %}"
+            "{% for p in products %}"
+            "{% cache 200 'product' p %}{{ expensive(p) }}{% endcache %}{{ uncached(p) }}|"
+            "{% endfor %}{% endcache_prefetch %}"
+        )
+        expensive = mock.Mock(side_effect=lambda p: f"p{p}")
+        uncached = mock.Mock(side_effect=lambda p: f"u{p}")
+        cache.clear()
+
+        for _ in range(2):
+            with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+                result = template.render({"products": iter([1, 2, 3]), "pks": [1, 2, 3],
+                                          "expensive": expensive, "uncached": uncached})
+            self.assertEqual(result, "p1u1|p2u2|p3u3|")
+            self.assertEqual(get_many.call_count, 1)
+            self.assertEqual(len(get_many.call_args[0][0]), 6)
+        self.assertEqual(expensive.call_count, 3)
+        self.assertEqual(uncached.call_count, 6)
+
+        # Fragments that were not prefetched are fetched on demand.
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            result = template.render({"products": iter([3, 4]), "pks": [],
+                                      "expensive": expensive, "uncached": uncached})
+        self.assertEqual(result, "p3u3|p4u4|")
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual(expensive.call_count, 4)
+
+        # Expired local entries are fetched from the shared cache.
+        env = Jinja2({
+            "NAME": "jinja2prefetchlocal",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {"fragment_cache": {"local_max_entries": 10, "local_timeout": 1,
+                                           "request_memo": False}},
+        })
+        template = env.from_string(
+            "{% cache_prefetch 'product', pks %}{% for p in pks %}"
+            "{% cache 200 'product' p %}{{ expensive(p) }}{% endcache %}"
+            "{% endfor %}{% endcache_prefetch %}"
+        )
+        context = {"pks": [1, 2], "expensive": expensive}
+        self.assertEqual(template.render(context), "p1p2")
+        self.assertEqual(expensive.call_count, 4)
+
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(template.render(context), "p1p2")
+            self.assertEqual(get_many.call_count, 0)
+
+            now = time.monotonic()
+            with mock.patch("django_jinja.cache.time.monotonic", return_value=now + 2):
+                self.assertEqual(template.render(context), "p1p2")
+            self.assertEqual(get_many.call_count, 1)
+            self.assertEqual(len(get_many.call_args[0][0]), 2)
+        self.assertEqual(expensive.call_count, 4)
+
+    def test_cache_request_memo(self):
+        template = self.env.from_string(
+            "{% for i in range(3) %}{% cache 200 'memo' %}{{ value }}{% endcache %}{% endfor %}"
+        )
+        cache.clear()
+        request = self.factory.get("/")
+
+        with mock.patch.object(cache, "get", wraps=cache.get) as cache_get:
+            self.assertEqual(template.render({"value": "a"}, request), "aaa")
+            self.assertEqual(cache_get.call_count, 1)
+            self.assertEqual("".join(template.stream({"value": "b"}, request)), "aaa")
+            self.assertEqual(cache_get.call_count, 1)
+
+            # Without request (or with another one) the shared cache is used.
+            self.assertEqual(template.render({"value": "c"}), "aaa")
+            self.assertEqual(cache_get.call_count, 4)
+
+        # Prefetch blocks skip the fragments already in the memo.
+        template = self.env.from_string(
+            "{% cache_prefetch 'memo', [()], 'memo2', [()] %}{% cache 200 'memo' %}x{% endcache %}"
+            "{% cache 200 'memo2' %}{{ value }}{% endcache %}{% endcache_prefetch %}"
+        )
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(template.render({"value": "d"}, request), "ad")
+        self.assertEqual(get_many.call_args[0][0], [make_template_fragment_key("memo2")])
+
+    def test_cache_tags(self):
+        fragment_cache = self.env.env.fragment_cache
+        template = self.env.from_string(
+            "{% cache 200 'tagged' name tags=['catalog', name] %}{{ value }}{% endcache %}"
+        )
+        cache.clear()
+
+        self.assertEqual(template.render({"name": "a", "value": 1}), "1")
+        self.assertEqual(template.render({"name": "b", "value": 1}), "1")
+        self.assertEqual(template.render({"name": "a", "value": 2}), "1")
+
+        fragment_cache.invalidate_tags("b")
+        self.assertEqual(template.render({"name": "a", "value": 2}), "1")
+        self.assertEqual(template.render({"name": "b", "value": 2}), "2")
+
+        fragment_cache.invalidate_tags("catalog")
+        self.assertEqual(template.render({"name": "a", "value": 3}), "3")
+        self.assertEqual(template.render({"name": "b", "value": 3}), "3")
+
+        # A lost generation counter does not bring old fragments back.
+        cache.delete(fragment_cache.get_tag_key("catalog"))
+        self.assertEqual(template.render({"name": "a", "value": 4}), "4")
+
+        # Fragments and generations are fetched in a single query.
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(template.render({"name": "a", "value": 5}), "4")
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(len(get_many.call_args[0][0]), 3)
+
+        template = self.env.from_string(
+            "{% cache_prefetch 'tagged', names tags=['catalog'] + names %}{% for name in names %}"
+            "{% cache 200 'tagged' name tags=['catalog', name] %}{{ value }}{% endcache %}"
+            "{% endfor %}{% endcache_prefetch %}"
+        )
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(template.render({"names": ["a", "b", "c"], "value": 5}), "455")
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(len(get_many.call_args[0][0]), 7)
+
+        fragment_cache.invalidate_tags("catalog")
+        self.assertEqual(template.render({"names": ["a", "b", "c"], "value": 6}), "666")
+
+        # Tags may come first.
+        template = self.env.from_string(
+            "{% cache_prefetch tags=['catalog'] + names, 'tagged', names %}{% for name in names %}"
+            "{% cache 200 'tagged' name tags=['catalog', name] %}{{ value }}{% endcache %}"
+            "{% endfor %}{% endcache_prefetch %}"
+        )
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            self.assertEqual(template.render({"names": ["a", "b", "c"], "value": 7}), "666")
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(len(get_many.call_args[0][0]), 7)
+
+    @override_settings(CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "fragments": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "fragments",
+        },
+    })
+    def test_cache_fragment_storage(self):
+        from django.core.cache import caches
+
+        env = Jinja2({
+            "NAME": "jinja2fragmentstorage",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "fragment_cache": {
+                    "cache_name": "fragments",
+                    "compress": "zlib",
+                    "compress_min_size": 100,
+                    "local_max_entries": 10,
+                    "request_memo": False,
+                },
+            },
+        })
+        fragments = caches["fragments"]
+        template = env.from_string("{% cache 200 'storage' size %}{{ 'x' * size }}{% endcache %}")
+
+        self.assertEqual(template.render({"size": 10}), "x" * 10)
+        self.assertEqual(template.render({"size": 200}), "x" * 200)
+        self.assertIsNone(caches["default"].get(make_template_fragment_key("storage", [10])))
+        self.assertEqual(fragments.get(make_template_fragment_key("storage", [10])), "x" * 10)
+        self.assertTrue(fragments.get(make_template_fragment_key("storage", [200])).startswith(b"zlib:"))
+
+        # Served from process memory, and from the shared cache once evicted.
+        with mock.patch.object(fragments, "get", wraps=fragments.get) as cache_get:
+            self.assertEqual(template.render({"size": 200}), "x" * 200)
+            self.assertEqual(cache_get.call_count, 0)
+            env.env.fragment_cache.clear()
+            self.assertEqual(template.render({"size": 200}), "x" * 200)
+            self.assertEqual(cache_get.call_count, 1)
+
+        # Generations of per object tags are bounded by the local cache size.
+        template = env.from_string("{% cache 200 'obj' pk tags=['obj-%d' % pk] %}{{ pk }}{% endcache %}")
+        for pk in range(100):
+            template.render({"pk": pk})
+        self.assertEqual(len(env.env.fragment_cache._generations), 40)
+        self.assertIsNone(self.env.env.fragment_cache._generations)
+
+        with self.assertRaises(ImproperlyConfigured):
+            Jinja2({
+                "NAME": "jinja2fragmentinvalid",
+                "DIRS": [],
+                "APP_DIRS": False,
+                "OPTIONS": {"fragment_cache": {"compress": "gzip"}},
+            })
+
     def test_404_page(self):
         response = self.client.get(reverse("page-404"))
         self.assertEqual(response.status_code, 404)
@@ -319,6 +928,670 @@ class RenderTemplatesTests(TestCase):
             template.render(context).encode()
         )
 
+    def test_get_template_memoized(self):
+        template1 = self.env.get_template("hello_world.jinja")
+        template2 = self.env.get_template("hello_world.jinja")
+        self.assertIs(template1, template2)
+
+    def test_get_template_memoized_auto_reload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "reload.jinja")
+            with open(filename, "w") as f:
+                f.write("first")
+
+            env = Jinja2({
+                "NAME": "jinja2reload",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {"auto_reload": True},
+            })
+
+            template1 = env.get_template("reload.jinja")
+            self.assertIs(template1, env.get_template("reload.jinja"))
+            self.assertEqual(template1.render(), "first")
+
+            with open(filename, "w") as f:
+                f.write("second")
+            mtime = time.time() + 10
+            os.utime(filename, (mtime, mtime))
+
+            template2 = env.get_template("reload.jinja")
+            self.assertIsNot(template1, template2)
+            self.assertEqual(template2.render(), "second")
+
+    def test_context_processors_cache(self):
+        env = Jinja2({
+            "NAME": "jinja2cp",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "context_processors": [
+                    "testapp.context_processors.counter",
+                    "testapp.context_processors.uncached_counter",
+                ],
+                "context_processors_cache": {
+                    "enabled": True,
+                    "exclude": ["testapp.context_processors.uncached_counter"],
+                },
+            },
+        })
+        template = env.from_string("{{ counter }}-{{ uncached_counter }}")
+
+        with mock.patch.dict(context_processors.calls, counter=0, uncached_counter=0):
+            request1 = self.factory.get("/")
+            self.assertEqual(template.render({}, request1), "1-1")
+            self.assertEqual(template.render({}, request1), "1-2")
+
+            request2 = self.factory.get("/")
+            self.assertEqual(template.render({}, request2), "2-3")
+
+    def test_context_processors_cache_disabled(self):
+        env = Jinja2({
+            "NAME": "jinja2cp",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "context_processors": ["testapp.context_processors.counter"],
+            },
+        })
+        template = env.from_string("{{ counter }}")
+
+        with mock.patch.dict(context_processors.calls, counter=0):
+            request = self.factory.get("/")
+            self.assertEqual(template.render({}, request), "1")
+            self.assertEqual(template.render({}, request), "2")
+
+    def test_lazy_context_processors(self):
+        env = Jinja2({
+            "NAME": "jinja2cp",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "context_processors": [
+                    "testapp.context_processors.counter",
+                    "testapp.context_processors.lazy_counter",
+                ],
+                "lazy_context_processors": {
+                    "testapp.context_processors.lazy_counter": ["lazy_counter", "lazy_other"],
+                },
+            },
+        })
+
+        with mock.patch.dict(context_processors.calls, counter=0, lazy_counter=0):
+            request = self.factory.get("/")
+
+            template = env.from_string("{{ counter }}")
+            self.assertEqual(template.render({}, request), "1")
+            self.assertEqual(context_processors.calls["lazy_counter"], 0)
+
+            template = env.from_string("{{ lazy_counter }}-{{ lazy_other }}-{{ lazy_counter }}")
+            self.assertEqual(template.render({"lazy_counter": "view"}, request), "1-other-1")
+            self.assertEqual(context_processors.calls["lazy_counter"], 1)
+
+            template = env.from_string("{% set lazy_counter = 'local' %}{{ lazy_counter }}")
+            self.assertEqual(template.render({}, request), "local")
+
+    def test_lazy_context_processors_improperly_configured(self):
+        env = Jinja2({
+            "NAME": "jinja2cp",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "lazy_context_processors": {
+                    "testapp.context_processors.lazy_counter": ["lazy_counter"],
+                },
+            },
+        })
+        template = env.from_string("{{ lazy_counter }}")
+
+        with self.assertRaises(ImproperlyConfigured):
+            template.render({}, self.factory.get("/"))
+
+    def test_get_template_variables(self):
+        self.assertEqual(
+            self.env.get_template_variables("variables/child.jinja"),
+            frozenset(["title", "items", "prefix"]),
+        )
+        self.assertIsNone(self.env.get_template_variables("variables/dynamic.jinja"))
+
+    def test_jinjavariables_command(self):
+        out = io.StringIO()
+        call_command("jinjavariables", "variables/child.jinja", "variables/dynamic.jinja", stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            "variables/child.jinja: items, prefix, title",
+            "variables/dynamic.jinja: partial_name (incomplete, dynamic references in: variables/dynamic.jinja)",
+        ])
+
+    def test_render_async(self):
+        env = Jinja2({
+            "NAME": "jinja2async",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "enable_async": True,
+                "context_processors": [
+                    "testapp.context_processors.counter",
+                    "testapp.context_processors.async_counter",
+                ],
+            },
+        })
+
+        async def greeting(name):
+            return f"Hello {name}"
+
+        env.env.globals["greeting"] = greeting
+        template = env.from_string(
+            "{{ greeting(name) }} {{ counter }} {{ async_counter }}"
+            "{% cache 200 'async-fragment' %}{{ greeting('cache') }}{% endcache %}"
+        )
+
+        async def _stream():
+            return "".join([chunk async for chunk in template.stream_async({"name": "foo"}, request)])
+
+        with mock.patch.dict(context_processors.calls, counter=0, async_counter=0):
+            request = self.factory.get("/")
+            result = asyncio.run(template.render_async({"name": "foo"}, request))
+            self.assertEqual(result, "Hello foo 1 1Hello cache")
+            self.assertEqual(asyncio.run(_stream()), "Hello foo 2 2Hello cache")
+
+        template = env.from_string("{% cache 200 'async-fragment' %}not rendered{% endcache %}")
+        self.assertEqual(asyncio.run(template.render_async()), "Hello cache")
+
+    def test_render_async_context_processors(self):
+        from django.utils.asyncio import async_unsafe
+
+        env = Jinja2({
+            "NAME": "jinja2asynclazy",
+            "DIRS": [],
+            "APP_DIRS": False,
+            "OPTIONS": {
+                "enable_async": True,
+                "context_processors": [
+                    "testapp.context_processors.lazy_counter",
+                    "testapp.context_processors.async_lazy",
+                ],
+                "lazy_context_processors": {
+                    "testapp.context_processors.lazy_counter": ["lazy_counter"],
+                    "testapp.context_processors.async_lazy": ["async_lazy"],
+                },
+            },
+        })
+        template = env.from_string("{{ lazy_counter }} {{ async_lazy }}")
+
+        with mock.patch.dict(context_processors.calls, lazy_counter=0, async_lazy=0):
+            result = asyncio.run(template.render_async({}, self.factory.get("/")))
+        self.assertEqual(result, "1 1")
+
+        # Sync context processors run outside of the event loop.
+        @async_unsafe
+        def orm_processor(request):
+            return {"orm": "ok"}
+
+        env.context_processors = (orm_processor,)
+        env.eager_context_processors = (orm_processor,)
+        template = env.from_string("{{ orm }}")
+        self.assertEqual(asyncio.run(template.render_async({}, self.factory.get("/"))), "ok")
+
+    def test_streaming_buffer(self):
+        template = get_template("streaming_flush_test.jinja")
+        chunks = list(template.stream({"name": "foo"}, buffer_size=20))
+
+        self.assertEqual(chunks[0], "<head><title>foo</title></head>")
+        self.assertTrue(all(len(chunk) >= 20 for chunk in chunks[1:-1]))
+        self.assertEqual("".join(chunks), template.render({"name": "foo"}))
+
+    def test_flush_tag_outside_streaming(self):
+        template = self.env.from_string("foo{% flush %}bar")
+        self.assertEqual(template.render(), "foobar")
+        self.assertEqual("".join(template.stream()), "foobar")
+
+    def test_streaming_template_response(self):
+        response = self.client.get(reverse("streaming-flush-test"))
+        self.assertEqual(response.context["name"], "Streaming Jinja2")
+        self.assertTemplateUsed(response, "streaming_flush_test.jinja")
+
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0], b"<head><title>Streaming Jinja2</title></head>")
+
+    def test_compiled_templates(self):
+        with tempfile.TemporaryDirectory() as srcdir, tempfile.TemporaryDirectory() as compiled:
+            filename = os.path.join(srcdir, "compiled.jinja")
+            with open(filename, "w") as f:
+                f.write("{{ url('test-1') }} {{ name }}")
+
+            params = {
+                "NAME": "jinja2compiled",
+                "DIRS": [srcdir],
+                "APP_DIRS": False,
+                "OPTIONS": {"compiled_templates": compiled},
+            }
+            Jinja2(params).compile_templates(compiled)
+            os.remove(filename)
+
+            template = Jinja2(params).get_template("compiled.jinja")
+            self.assertEqual(template.render({"name": "foo"}), "/test1/ foo")
+
+    def test_compiled_templates_variables(self):
+        with tempfile.TemporaryDirectory() as srcdir, tempfile.TemporaryDirectory() as compiled:
+            with open(os.path.join(srcdir, "compiled.jinja"), "w") as f:
+                f.write("{{ name }}")
+
+            params = {
+                "NAME": "jinja2compiledvariables",
+                "DIRS": [srcdir],
+                "APP_DIRS": False,
+                "OPTIONS": {"compiled_templates": compiled},
+            }
+            env = Jinja2(params)
+            env.compile_templates(compiled)
+            env = Jinja2(params)
+            self.assertEqual(env.get_template_variables("compiled.jinja"), frozenset(["name"]))
+
+            out = io.StringIO()
+            with override_settings(TEMPLATES=[{"BACKEND": "django_jinja.jinja2.Jinja2", **params}]):
+                call_command("jinjavariables", stdout=out)
+            self.assertEqual(out.getvalue().splitlines(), ["compiled.jinja: name"])
+
+    def test_compilejinja_command(self):
+        with tempfile.TemporaryDirectory() as compiled:
+            call_command("compilejinja", compiled)
+            self.assertIn(
+                jinja2.ModuleLoader.get_module_filename("hello_world.jinja"),
+                os.listdir(compiled),
+            )
+            self.assertNotIn(
+                jinja2.ModuleLoader.get_module_filename("i18n_test.html"),
+                os.listdir(compiled),
+            )
+
+    def test_warmup(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.jinja", "b.jinja", "c.html"):
+                with open(os.path.join(tmpdir, name), "w") as f:
+                    f.write(name)
+            with open(os.path.join(tmpdir, "broken.jinja"), "w") as f:
+                f.write("{% if %}")
+
+            env = Jinja2({
+                "NAME": "jinja2warmup",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {},
+            })
+
+            with self.assertLogs("django_jinja.backend", "INFO"):
+                result = env.warmup(threads=2)
+
+            self.assertEqual(result["templates"], 2)
+            self.assertEqual(result["errors"], ["broken.jinja"])
+            self.assertEqual(len(env.env.cache), 2)
+
+    def test_warmup_on_ready(self):
+        setting = {
+            "append": [
+                {
+                    "BACKEND": "django_jinja.backend.Jinja2",
+                    "NAME": "jinja2warmup",
+                    "APP_DIRS": True,
+                    "OPTIONS": {
+                        "warmup": {"enabled": True},
+                    }
+                }
+            ]
+        }
+
+        with self.modify_settings(TEMPLATES=setting):
+            with mock.patch.object(Jinja2, "warmup") as warmup:
+                apps.get_app_config("django_jinja").warmup_templates()
+            warmup.assert_called_once_with()
+
+    def test_indexed_loader(self):
+        with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+            os.mkdir(os.path.join(dir2, "sub"))
+            for dirname, name in ((dir1, "a.jinja"), (dir2, "a.jinja"), (dir2, "sub/b.jinja")):
+                with open(os.path.join(dirname, name), "w") as f:
+                    f.write(f"{dirname} {name}")
+
+            env = Jinja2({
+                "NAME": "jinja2indexed",
+                "DIRS": [dir1, dir2],
+                "APP_DIRS": False,
+                "OPTIONS": {"loader": "django_jinja.loaders.IndexedFileSystemLoader"},
+            })
+            loader = env.env.loader
+
+            self.assertIsInstance(loader, IndexedFileSystemLoader)
+            self.assertTrue(loader.frozen)
+            self.assertEqual(env.get_template("a.jinja").render(), f"{dir1} a.jinja")
+            self.assertEqual(env.get_template("./sub/b.jinja").render(), f"{dir2} sub/b.jinja")
+            self.assertEqual(loader.list_templates(), ["a.jinja", "sub/b.jinja"])
+
+            with open(os.path.join(dir1, "c.jinja"), "w") as f:
+                f.write("c")
+
+            with self.assertRaises(TemplateDoesNotExist):
+                env.get_template("c.jinja")
+
+    def test_indexed_loader_reset_on_file_changed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            setting = [{
+                "BACKEND": "django_jinja.backend.Jinja2",
+                "NAME": "jinja2indexed",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {"loader": "django_jinja.loaders.IndexedFileSystemLoader"},
+            }]
+
+            with override_settings(DEBUG=True, TEMPLATES=setting):
+                env = engines["jinja2indexed"]
+                self.assertFalse(env.env.loader.frozen)
+                self.assertEqual(env.env.loader.list_templates(), [])
+
+                filename = os.path.join(tmpdir, "new.jinja")
+                with open(filename, "w") as f:
+                    f.write("new")
+
+                results = file_changed.send(sender=None, file_path=Path(filename).resolve())
+                self.assertIn(True, [result for _, result in results])
+                self.assertEqual(env.env.loader.list_templates(), ["new.jinja"])
+
+    def test_missing_templates_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            setting = [{
+                "BACKEND": "django_jinja.backend.Jinja2",
+                "NAME": "jinja2missing",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {"auto_reload": True},
+            }]
+
+            with override_settings(TEMPLATES=setting):
+                env = engines["jinja2missing"]
+
+                with mock.patch.object(env.env.loader, "get_source",
+                                       side_effect=jinja2.TemplateNotFound("missing.jinja")) as get_source:
+                    for _ in range(3):
+                        with self.assertRaises(TemplateDoesNotExist):
+                            env.get_template("missing.jinja")
+                self.assertEqual(get_source.call_count, 1)
+
+                filename = os.path.join(tmpdir, "missing.jinja")
+                with open(filename, "w") as f:
+                    f.write("found")
+
+                with self.assertRaises(TemplateDoesNotExist):
+                    env.get_template("missing.jinja")
+
+                file_changed.send(sender=None, file_path=Path(filename).resolve())
+                self.assertEqual(env.get_template("missing.jinja").render(), "found")
+
+                # Without the development server, missing templates are
+                # looked up again after a short time.
+                with self.assertRaises(TemplateDoesNotExist):
+                    env.get_template("added.jinja")
+                with open(os.path.join(tmpdir, "added.jinja"), "w") as f:
+                    f.write("added")
+                with self.assertRaises(TemplateDoesNotExist):
+                    env.get_template("added.jinja")
+
+                now = time.monotonic()
+                with mock.patch("django_jinja.backend.time.monotonic",
+                                return_value=now + env.missing_templates_ttl):
+                    self.assertEqual(env.get_template("added.jinja").render(), "added")
+
+    def test_two_tier_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "bytecode.jinja"), "w") as f:
+                f.write("{{ name }}")
+
+            params = {
+                "NAME": "jinja2bytecode",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "bytecode_cache": {
+                        "enabled": True,
+                        "backend": "django_jinja.cache.TwoTierBytecodeCache",
+                        "max_entries": 10,
+                    },
+                },
+            }
+            cache.clear()
+
+            env1 = Jinja2(params)
+            bytecode_cache = env1.env.bytecode_cache
+            self.assertIsInstance(bytecode_cache, TwoTierBytecodeCache)
+            self.assertEqual(bytecode_cache.local.max_entries, 10)
+
+            env1.env.get_template("bytecode.jinja")
+            env1.env.cache.clear()
+            self.assertEqual(env1.env.get_template("bytecode.jinja").render(name="foo"), "foo")
+
+            stats = bytecode_cache.stats()
+            self.assertEqual(stats["l1_hits"], 1)
+            self.assertEqual(stats["l1_misses"], 1)
+            self.assertEqual(stats["l2_misses"], 1)
+            self.assertEqual(stats["l1_entries"], 1)
+            self.assertGreater(stats["l1_size"], 0)
+
+            env2 = Jinja2(params)
+            self.assertEqual(env2.env.get_template("bytecode.jinja").render(name="bar"), "bar")
+            self.assertEqual(env2.env.bytecode_cache.stats()["l2_hits"], 1)
+
+    def test_bytecode_cache_preload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.jinja", "b.jinja"):
+                with open(os.path.join(tmpdir, name), "w") as f:
+                    f.write(name + "{{ name }}")
+
+            params = {
+                "NAME": "jinja2bytecode",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "bytecode_cache": {
+                        "enabled": True,
+                        "backend": "django_jinja.cache.TwoTierBytecodeCache",
+                    },
+                },
+            }
+            cache.clear()
+            Jinja2(params).warmup()
+
+            env = Jinja2(params)
+            with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+                self.assertEqual(env.warmup()["templates"], 2)
+
+            get_many.assert_called_once()
+            stats = env.env.bytecode_cache.stats()
+            self.assertEqual(stats["l1_hits"], 2)
+            self.assertEqual(stats["l1_misses"], 0)
+
+    def test_bytecode_cache_versioned_keys(self):
+        bytecode_cache = BytecodeCache("default")
+        key = bytecode_cache.get_bucket_key("a.jinja", "/a.jinja", "checksum")
+        self.assertNotEqual(key, bytecode_cache.get_bucket_key("a.jinja", "/a.jinja", "other"))
+        self.assertNotEqual(key, bytecode_cache.get_bucket_key("b.jinja", "/a.jinja", "checksum"))
+        # The same build deployed elsewhere shares the entries.
+        self.assertEqual(key, bytecode_cache.get_bucket_key("a.jinja", "/releases/2/a.jinja",
+                                                            "checksum"))
+
+        bytecode_cache.version_tag = "other-version"
+        self.assertNotEqual(key, bytecode_cache.get_bucket_key("a.jinja", "/a.jinja", "checksum"))
+
+    def test_bytecode_cache_compression(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "compressed.jinja"), "w") as f:
+                f.write("{% for i in items %}{{ i }}{% endfor %}" * 20)
+
+            params = {
+                "NAME": "jinja2bytecode",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "bytecode_cache": {
+                        "enabled": True,
+                        "compress": "zlib",
+                        "compress_min_size": 100,
+                    },
+                },
+            }
+            cache.clear()
+
+            env1 = Jinja2(params)
+            with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+                env1.env.get_template("compressed.jinja")
+            self.assertTrue(cache_set.call_args[0][1].startswith(b"zlib:"))
+
+            sizes = env1.env.bytecode_cache.size_stats()["compressed.jinja"]
+            self.assertLess(sizes["stored_size"], sizes["size"])
+
+            env2 = Jinja2(params)
+            with mock.patch.object(env2.env, "compile", wraps=env2.env.compile) as compile:
+                template = env2.env.get_template("compressed.jinja")
+            compile.assert_not_called()
+            self.assertEqual(template.render(items=[1, 2]), "12" * 20)
+            self.assertEqual(env2.env.bytecode_cache.size_stats()["compressed.jinja"], sizes)
+
+    def test_bytecode_cache_invalid_compression(self):
+        with self.assertRaises(ImproperlyConfigured):
+            BytecodeCache("default", compress="gzip")
+
+    def test_mmap_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as cachedir:
+            with open(os.path.join(tmpdir, "mmap.jinja"), "w") as f:
+                f.write("{{ name }}")
+
+            params = {
+                "NAME": "jinja2mmap",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "bytecode_cache": {
+                        "enabled": True,
+                        "backend": "django_jinja.cache.MmapBytecodeCache",
+                        "directory": cachedir,
+                    },
+                },
+            }
+
+            env1 = Jinja2(params)
+            self.assertIsInstance(env1.env.bytecode_cache, MmapBytecodeCache)
+            env1.env.get_template("mmap.jinja")
+            files = os.listdir(cachedir)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].endswith(".cache"))
+
+            env2 = Jinja2(params)
+            with mock.patch.object(env2.env, "compile", wraps=env2.env.compile) as compile:
+                self.assertEqual(env2.env.get_template("mmap.jinja").render(name="foo"), "foo")
+            compile.assert_not_called()
+
+            # An empty file (never produced by the cache itself) is a miss.
+            with open(os.path.join(cachedir, files[0]), "wb"):
+                pass
+            env3 = Jinja2(params)
+            self.assertEqual(env3.env.get_template("mmap.jinja").render(name="bar"), "bar")
+
+            env3.env.bytecode_cache.clear()
+            self.assertEqual(os.listdir(cachedir), [])
+
+    @unittest.skipIf(os.name == "nt", "The temp dir is private to the user on windows")
+    def test_mmap_bytecode_cache_default_directory(self):
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch("django_jinja.cache.tempfile.gettempdir", return_value=tmpdir):
+            directory = MmapBytecodeCache("default").directory
+            self.assertEqual(directory,
+                             os.path.join(tmpdir, f"django-jinja-bytecode-{os.getuid()}-default"))
+            self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+            self.assertEqual(MmapBytecodeCache("default").directory, directory)
+
+            # A directory that other users can write to is refused.
+            os.chmod(directory, 0o777)
+            with self.assertRaises(ImproperlyConfigured):
+                MmapBytecodeCache("default")
+
+            os.rmdir(directory)
+            os.symlink(tmpdir, directory)
+            with self.assertRaises(ImproperlyConfigured):
+                MmapBytecodeCache("default")
+
+    def test_stats(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.jinja", "b.jinja"):
+                with open(os.path.join(tmpdir, name), "w") as f:
+                    f.write(name)
+
+            params = {
+                "NAME": "jinja2stats",
+                "DIRS": [tmpdir],
+                "APP_DIRS": False,
+                "OPTIONS": {
+                    "stats": True,
+                    "cache_size": 1,
+                    "bytecode_cache": {"enabled": True},
+                },
+            }
+            cache.clear()
+            events = []
+
+            def receiver(signal, sender, **kwargs):
+                events.append((signal, kwargs["template_name"]))
+
+            env = Jinja2(params)
+            for signal in (signals.template_compiled, signals.bytecode_loaded, signals.bytecode_dumped):
+                signal.connect(receiver, sender=env)
+
+            env.env.get_template("a.jinja")
+            env.env.get_template("a.jinja")
+            env.env.get_template("b.jinja")
+            env.env.get_template("a.jinja")
+
+            stats = env.get_stats()
+            self.assertEqual(stats["cache_hits"], 1)
+            self.assertEqual(stats["cache_misses"], 3)
+            self.assertEqual(stats["cache_evictions"], 2)
+            self.assertEqual(stats["cache_capacity"], 1)
+            self.assertEqual(stats["compiles"], 2)
+            self.assertEqual(set(stats["compile_times"]), {"a.jinja", "b.jinja"})
+            self.assertEqual(stats["bytecode_hits"], 1)
+            self.assertEqual(stats["bytecode_misses"], 2)
+            self.assertEqual(stats["bytecode_dumps"], 2)
+            self.assertAlmostEqual(stats["bytecode_hit_ratio"], 1 / 3)
+            self.assertEqual(events[:3], [
+                (signals.bytecode_loaded, "a.jinja"),
+                (signals.template_compiled, "a.jinja"),
+                (signals.bytecode_dumped, "a.jinja"),
+            ])
+
+            # Templates returned by the backend wrappers cache are hits too.
+            env = Jinja2(dict(params, NAME="jinja2stats2", OPTIONS={"stats": True}))
+            for _ in range(5):
+                env.get_template("a.jinja")
+            stats = env.get_stats()
+            self.assertEqual(stats["cache_hits"], 4)
+            self.assertEqual(stats["cache_misses"], 1)
+
+        self.assertIsNone(self.env.get_stats())
+
+    def test_memory_cache_bounds(self):
+        local = MemoryCache(max_entries=2, max_size=10)
+        local.set("a", "a", 4)
+        local.set("b", "b", 4)
+        local.get("a")
+        local.set("c", "c", 4)
+        self.assertIsNone(local.get("b"))
+        self.assertEqual(local.size, 8)
+
+        local.set("d", "d", 1)
+        self.assertEqual(len(local), 2)
+        self.assertEqual(local.get("a"), None)
+        self.assertEqual(local.get("c"), "c")
+
+        local.set("big", "big", 11)
+        self.assertIsNone(local.get("big"))
+
 
 class BaseTests(TestCase):
     def setUp(self):
@@ -1,14 +1,23 @@
+from django.urls import include
+from django.urls import path
 from django.urls import re_path as url
 from django_jinja import views
 
 from .views import BasicTestView
 from .views import I18nTestView, I18nTestViewDTL
-from .views import StreamingTestView
+from .views import StreamingTestView, StreamingFlushTestView
 from .views import CreateTestView, DeleteTestView, DetailTestView, UpdateTestView
 from .views import ListTestView
 from .views import ArchiveIndexTestView, YearArchiveTestView, MonthArchiveTestView, WeekArchiveTestView, DayArchiveTestView, TodayArchiveTestView, DateDetailTestView
 
+shop_patterns = ([
+    path("products/<int:pk>/", BasicTestView.as_view(), name="product-detail"),
+    path("products/<slug:slug>/<path:rest>", BasicTestView.as_view(), name="product-page"),
+], "shop")
+
 urlpatterns = [
+    path("shop/", include(shop_patterns)),
+    path("shop-eu/", include(shop_patterns, namespace="shop-eu")),
     url(r"^test1/$", BasicTestView.as_view(), name="test-1"),
     url(r"^test1/(?P<data>\d+)/$", BasicTestView.as_view(), name="test-1"),
     url(r"^test-i18n/$", I18nTestView.as_view(), name="i18n-test"),
@@ -17,6 +26,7 @@ urlpatterns = [
     url(r"^test/403$", views.PermissionDenied.as_view(), name="page-403"),
     url(r"^test/500$", views.ServerError.as_view(), name="page-500"),
     url(r"^test-streaming/$", StreamingTestView.as_view(), name='streaming-test'),
+    url(r"^test-streaming-flush/$", StreamingFlushTestView.as_view(), name='streaming-flush-test'),
 
     url(r"^testmodel/$", ListTestView.as_view()),
     url(r"^testmodel/create$", CreateTestView.as_view()),
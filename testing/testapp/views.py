@@ -1,9 +1,11 @@
+from django.views.generic import TemplateView
 from django.views.generic import View
 from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template import loader
 from django.template.loader import render_to_string
 
+from django_jinja.response import StreamingTemplateResponse
 from django_jinja.views.generic.detail import DetailView
 from django_jinja.views.generic.edit import CreateView, DeleteView, UpdateView
 from django_jinja.views.generic.list import ListView
@@ -102,3 +104,14 @@ class StreamingTestView(View):
         context = {"name": "Streaming Jinja2", "view": type(self)}
         template = loader.get_template('streaming_test.jinja')
         return StreamingHttpResponse(template.stream(context, request), content_type='text/html')
+
+class StreamingFlushTestView(TemplateView):
+    template_name = "streaming_flush_test.jinja"
+    response_class = StreamingTemplateResponse
+
+    def get_context_data(self, **kwargs):
+        return {"name": "Streaming Jinja2"}
+
+    def render_to_response(self, context, **response_kwargs):
+        response_kwargs.setdefault("buffer_size", 1024)
+        return super().render_to_response(context, **response_kwargs)